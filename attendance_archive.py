@@ -0,0 +1,100 @@
+"""Durable local archives of device attendance logs.
+
+An archive is the device's raw attendance buffer, byte for byte, plus a
+JSON manifest with the record count and SHA-256 checksum:
+
+    archive/192.168.1.201_4370/attendance_20260917_183000.dat
+    archive/192.168.1.201_4370/attendance_20260917_183000.json
+
+Both files are fsynced and renamed into place, the manifest last, so a
+manifest only exists for a complete buffer. read_archive decodes a buffer
+back into a punch frame, e.g. to re-import it into the store.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from attendance_system import AttendanceDecoder
+
+
+class ArchiveError(Exception):
+    """An archive could not be written or does not match the device"""
+
+
+def _write_durably(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _sync_directory(path):
+    # Make the renames themselves durable; not possible on Windows
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def write_archive(directory, device, data, records):
+    """Write a raw attendance buffer and its manifest; return the manifest plus its path"""
+    folder = os.path.join(directory, device.replace(':', '_'))
+    os.makedirs(folder, exist_ok=True)
+    stem = os.path.join(folder, f"attendance_{datetime.now():%Y%m%d_%H%M%S}")
+    if os.path.exists(stem + ".json"):
+        # Never overwrite an earlier archive taken within the same second
+        stem += f"_{len([n for n in os.listdir(folder) if n.endswith('.json')])}"
+    manifest = {
+        'device': device,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'records': records,
+        'bytes': len(data),
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'data': os.path.basename(stem) + ".dat",
+    }
+    _write_durably(stem + ".dat", data)
+    _write_durably(stem + ".json", json.dumps(manifest, indent=2).encode())
+    _sync_directory(folder)
+    return dict(manifest, path=stem + ".json")
+
+
+def load_manifest(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _read_data(manifest_path, manifest):
+    with open(os.path.join(os.path.dirname(manifest_path), manifest['data']), "rb") as f:
+        return f.read()
+
+
+def verify_archive(manifest_path, records=None, sha256=None):
+    """Re-read an archive from disk and check its checksum and record count.
+
+    records and sha256 default to the manifest's own values; pass the
+    device's figures to check against the device. Raises ArchiveError on
+    any mismatch and returns the manifest otherwise.
+    """
+    manifest = load_manifest(manifest_path)
+    data = _read_data(manifest_path, manifest)
+    digest = hashlib.sha256(data).hexdigest()
+    if digest != manifest['sha256'] or (sha256 is not None and digest != sha256):
+        raise ArchiveError(f"Checksum mismatch for {manifest['data']}")
+    expected = manifest['records'] if records is None else records
+    decoder = AttendanceDecoder(manifest['records'])
+    decoder.feed(data)
+    if decoder.count != expected or manifest['records'] != expected:
+        raise ArchiveError(f"{manifest['data']} holds {decoder.count} records, expected {expected}")
+    return manifest
+
+
+def read_archive(manifest_path, users_by_uid=None):
+    """Decode an archived buffer into a punch frame (user_id, timestamp, raw_status, punch)"""
+    manifest = load_manifest(manifest_path)
+    decoder = AttendanceDecoder(manifest['records'], users_by_uid)
+    decoder.feed(_read_data(manifest_path, manifest))
+    return decoder.frame()
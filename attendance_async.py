@@ -0,0 +1,412 @@
+"""Asyncio client for ZKTeco terminals.
+
+pyzk's ZK client blocks a thread per device. AsyncZK speaks the same TCP
+protocol on port 4370 over asyncio streams: connect (with comm-key auth),
+memory counters, user download, attendance download and disconnect. One
+event loop can then poll hundreds of terminals, each costing a socket and
+a coroutine rather than a thread.
+
+    result = asyncio.run(collect_async(load_devices(), start_date, end_date))
+
+AsyncZKTecoAttendance mirrors ZKTecoAttendance without a local store: its
+get_raw_attendance and get_attendance coroutines return the same frames.
+Attendance buffers are decoded chunk by chunk as they arrive (see
+attendance_system.AttendanceDecoder), so no pyzk Attendance objects are
+built and only one chunk of raw bytes is held per connection.
+"""
+import asyncio
+import logging
+import struct
+import time
+from struct import pack, unpack
+import pandas as pd
+from zk import const
+from zk.base import make_commkey
+from zk.exception import ZKErrorConnection, ZKErrorResponse, ZKNetworkError
+from zk.user import User
+from attendance_collector import CollectionResult, device_entry, merge_punches
+from attendance_metrics import metrics
+from attendance_system import AttendanceDecoder, decorate_raw, normalize_range, pair_attendance, slice_range
+
+log = logging.getLogger(__name__)
+
+CMD_READ_BUFFER = 1503  # Prepare a buffered read (pyzk's read_with_buffer)
+CMD_READ_CHUNK = 1504  # Read one chunk of the prepared buffer
+MAX_CHUNK = 0xFFC0  # Largest chunk pyzk requests over TCP
+
+
+def _checksum(packet):
+    """Packet checksum (zkemsdk.c), matching pyzk's __create_checksum"""
+    if len(packet) % 2:
+        packet += b'\x00'
+    total = 0
+    for (word,) in struct.iter_unpack('<H', packet):
+        total += word
+        if total > const.USHRT_MAX:
+            total -= const.USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += const.USHRT_MAX
+    return total
+
+
+def _request(command, payload, session_id, reply_id):
+    """Request body (header + payload) built like pyzk's __create_header.
+
+    pyzk checksums the header carrying the last reply id it saw and then
+    sends the next id, so the checksum covers a different reply id than
+    the packet holds.
+    """
+    checksum = _checksum(pack('<4H', command, 0, session_id, reply_id) + payload)
+    reply_id += 1
+    if reply_id >= const.USHRT_MAX:
+        reply_id -= const.USHRT_MAX
+    return pack('<4H', command, checksum, session_id, reply_id) + payload
+
+
+def _iter_records(fmt, data, size):
+    """Unpack whole fixed-size records from data, ignoring a partial tail"""
+    return struct.iter_unpack(fmt, data[:len(data) - len(data) % size])
+
+
+class AsyncZK:
+    """One TCP connection to a terminal, driven from an asyncio event loop.
+
+    Every request waits at most ``timeout`` seconds for each reply packet.
+    Network failures raise ZKNetworkError and refused commands raise
+    ZKErrorResponse, as in pyzk.
+    """
+
+    def __init__(self, ip, port=4370, timeout=5, password=0, encoding='UTF-8'):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.password = password
+        self.encoding = encoding
+        self.is_connect = False
+        self.users = 0
+        self.records = 0
+        self.users_cap = 0
+        self.users_av = 0
+        self.rec_cap = 0
+        self.user_packet_size = 72
+        self._reader = None
+        self._writer = None
+        self._session_id = 0
+        self._reply_id = const.USHRT_MAX - 1
+
+    async def _receive(self):
+        """Read one packet; return (command, payload, session id)"""
+        try:
+            top = await asyncio.wait_for(self._reader.readexactly(8), self.timeout)
+            magic1, magic2, length = unpack('<HHI', top)
+            if (magic1, magic2) != (const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2) or length < 8:
+                raise ZKNetworkError("TCP packet invalid")
+            body = await asyncio.wait_for(self._reader.readexactly(length), self.timeout)
+        except asyncio.TimeoutError:
+            raise ZKNetworkError("timed out") from None
+        except (asyncio.IncompleteReadError, OSError) as e:
+            raise ZKNetworkError(str(e)) from None
+        command, _, session_id, reply_id = unpack('<4H', body[:8])
+        self._reply_id = reply_id
+        return command, body[8:], session_id
+
+    async def _command(self, command, payload=b''):
+        """Send one command and return (reply command, reply payload)"""
+        if command not in (const.CMD_CONNECT, const.CMD_AUTH) and not self.is_connect:
+            raise ZKErrorConnection("instance are not connected.")
+        body = _request(command, payload, self._session_id, self._reply_id)
+        try:
+            self._writer.write(pack('<HHI', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2, len(body)) + body)
+            await self._writer.drain()
+        except OSError as e:
+            raise ZKNetworkError(str(e)) from None
+        reply, data, session_id = await self._receive()
+        if command == const.CMD_CONNECT:
+            self._session_id = session_id
+        return reply, data
+
+    async def connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip, self.port), self.timeout
+            )
+        except (asyncio.TimeoutError, OSError) as e:
+            raise ZKNetworkError(f"can't reach device ({e or 'timed out'})") from None
+        self._session_id = 0
+        self._reply_id = const.USHRT_MAX - 1
+        try:
+            reply, _ = await self._command(const.CMD_CONNECT)
+            if reply == const.CMD_ACK_UNAUTH:
+                reply, _ = await self._command(const.CMD_AUTH, make_commkey(self.password, self._session_id))
+            if reply != const.CMD_ACK_OK:
+                raise ZKErrorResponse("Unauthenticated" if reply == const.CMD_ACK_UNAUTH
+                                      else "Invalid response: Can't connect")
+        except Exception:
+            await self._close()
+            raise
+        self.is_connect = True
+        return self
+
+    async def disconnect(self):
+        try:
+            if self.is_connect:
+                await self._command(const.CMD_EXIT)
+        finally:
+            self.is_connect = False
+            await self._close()
+
+    async def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+            self._reader = None
+
+    async def read_sizes(self):
+        """Read the memory counters (users, records, capacities)"""
+        reply, data = await self._command(const.CMD_GET_FREE_SIZES)
+        if reply != const.CMD_ACK_OK:
+            raise ZKErrorResponse("can't read sizes")
+        if len(data) >= 80:
+            fields = unpack('20i', data[:80])
+            self.users = fields[4]
+            self.records = fields[8]
+            self.users_cap = fields[15]
+            self.rec_cap = fields[16]
+            self.users_av = fields[18]
+        return True
+
+    async def _read_chunk(self, start, size):
+        for _ in range(3):
+            reply, data = await self._command(CMD_READ_CHUNK, pack('<ii', start, size))
+            if reply == const.CMD_DATA:
+                return data
+            if reply == const.CMD_PREPARE_DATA:
+                chunks = []
+                while True:
+                    reply, data, _ = await self._receive()
+                    if reply == const.CMD_DATA:
+                        chunks.append(data)
+                    elif reply == const.CMD_ACK_OK:
+                        return b''.join(chunks)
+                    else:
+                        break
+        raise ZKErrorResponse(f"can't read chunk {start}:[{size}]")
+
+    async def iter_buffer(self, command, fct=0, ext=0):
+        """Yield a buffered table (users, attendance) chunk by chunk as it arrives"""
+        reply, data = await self._command(CMD_READ_BUFFER, pack('<bhii', 1, command, fct, ext))
+        if reply == const.CMD_DATA:
+            # Small tables come back whole in the reply
+            yield data
+            return
+        if reply != const.CMD_ACK_OK:
+            raise ZKErrorResponse("RWB Not supported")
+        size = unpack('<I', data[1:5])[0]
+        start = 0
+        while start < size:
+            chunk = min(MAX_CHUNK, size - start)
+            yield await self._read_chunk(start, chunk)
+            start += chunk
+        reply, _ = await self._command(const.CMD_FREE_DATA)
+        if reply != const.CMD_ACK_OK:
+            raise ZKErrorResponse("can't free data")
+
+    async def read_buffer(self, command, fct=0, ext=0):
+        return b''.join([chunk async for chunk in self.iter_buffer(command, fct, ext)])
+
+    async def get_users(self):
+        """Return the device's users as pyzk User objects"""
+        await self.read_sizes()
+        if self.users == 0:
+            return []
+        data = await self.read_buffer(const.CMD_USERTEMP_RRQ, const.FCT_USER)
+        if len(data) <= 4:
+            log.warning("Missing user data from %s", self.ip)
+            return []
+        self.user_packet_size = unpack('<I', data[:4])[0] / self.users
+        decode = lambda raw: raw.split(b'\x00')[0].decode(self.encoding, errors='ignore')
+        users = []
+        if self.user_packet_size == 28:
+            for uid, privilege, password, name, card, group_id, _, user_id in \
+                    _iter_records('<HB5s8sIxBhI', data[4:], 28):
+                name = decode(name).strip() or f"NN-{user_id}"
+                users.append(User(uid, name, privilege, decode(password), str(group_id), str(user_id), card))
+        else:
+            for uid, privilege, password, name, card, group_id, user_id in \
+                    _iter_records('<HB8s24sIx7sx24s', data[4:], 72):
+                user_id = decode(user_id)
+                name = decode(name).strip() or f"NN-{user_id}"
+                users.append(User(uid, name, privilege, decode(password), decode(group_id).strip(), user_id, card))
+        return users
+
+    async def get_attendance_records(self, users_by_uid=None, chunk_records=65536):
+        """Download the attendance buffer, decoding each chunk as it arrives.
+
+        Returns the AttendanceDecoder; only one chunk of raw bytes is held at
+        a time.
+        """
+        await self.read_sizes()
+        decoder = AttendanceDecoder(self.records, users_by_uid, chunk_records)
+        if self.records:
+            async for chunk in self.iter_buffer(const.CMD_ATTLOG_RRQ):
+                decoder.feed(chunk)
+        return decoder
+
+
+class AsyncZKTecoAttendance:
+    """Asyncio counterpart of ZKTecoAttendance for one device.
+
+    Covers connect, users, raw and paired attendance and disconnect; the
+    frames match ZKTecoAttendance's column for column. There is no local
+    store or live capture here: use ZKTecoAttendance for those.
+    """
+
+    def __init__(self, ip_address, port=4370, timeout=5, password=0):
+        self.ip_address = ip_address
+        self.port = port
+        self.client = AsyncZK(ip_address, port=port, timeout=timeout, password=password)
+        self.conn = None
+        self.users = {}
+        self.users_by_uid = {}  # Device uid -> user_id, for 8-byte attendance records
+        self.device_key = f"{ip_address}:{port}"
+        self.last_error = None
+
+    async def connect(self):
+        try:
+            with metrics.stage("connect", self.device_key):
+                self.conn = await self.client.connect()
+            self.last_error = None
+            await self.load_users()
+            log.info("Successfully connected to device at %s", self.ip_address)
+        except Exception as e:
+            log.error("Error connecting to device %s: %s", self.device_key, e)
+            self.last_error = str(e)
+            self.conn = None
+
+    async def disconnect(self):
+        if self.conn:
+            try:
+                await self.conn.disconnect()
+            finally:
+                log.info("Disconnected from device %s", self.ip_address)
+                self.conn = None
+                self.users = {}
+                self.users_by_uid = {}
+
+    async def load_users(self):
+        if not self.conn:
+            return
+        try:
+            with metrics.stage("load_users", self.device_key) as stage:
+                users = await self.conn.get_users()
+                self.users = {user.user_id: user.name for user in users}
+                self.users_by_uid = {user.uid: user.user_id for user in users}
+                stage.records = len(self.users)
+                stage.bytes = len(users) * int(self.conn.user_packet_size)
+            log.info("Loaded %d users from device %s", len(self.users), self.ip_address)
+        except Exception as e:
+            log.error("Error loading users: %s", e)
+
+    async def get_raw_attendance(self, start_date=None, end_date=None, device_name=None):
+        """Return punches in the date range; same frame and errors as ZKTecoAttendance.get_raw_attendance"""
+        if not self.conn:
+            log.warning("Not connected to device. Please connect first.")
+            return None
+        try:
+            start_date, end_date = normalize_range(start_date, end_date)
+            with metrics.stage("download", self.device_key) as stage:
+                decoder = await self.conn.get_attendance_records(self.users_by_uid)
+                stage.records = decoder.count
+                stage.bytes = decoder.bytes
+            if not decoder.count:
+                log.info("No attendance records found")
+                return None
+            with metrics.stage("frame", self.device_key) as stage:
+                df = slice_range(decoder.frame(), start_date, end_date)
+                stage.records = len(df)
+            if df.empty:
+                log.info("No attendance records found")
+                return None
+            with metrics.stage("decorate", self.device_key) as stage:
+                stage.records = len(df)
+                return decorate_raw(df, self.users, device_name or self.device_key)
+        except Exception as e:
+            log.error("Error retrieving raw attendance records: %s", e)
+            raise
+
+    async def get_attendance(self, start_date=None, end_date=None):
+        """Return paired attendance; same frame as ZKTecoAttendance.get_attendance"""
+        df = await self.get_raw_attendance(start_date, end_date)
+        if df is None:
+            return None
+        with metrics.stage("pair", self.device_key) as stage:
+            result_df = pair_attendance(df)
+            stage.records = len(result_df)
+        log.info("Grouped into %d attendance records", len(result_df))
+        return result_df
+
+
+async def _fetch_device(device, start_date, end_date, timeout, device_timeout, slots):
+    entry = device_entry(device)
+    async with slots:
+        started = time.monotonic()
+        attendance_system = AsyncZKTecoAttendance(entry['ip'], port=entry['port'], timeout=timeout,
+                                                  password=int(device.get('password', 0)))
+        records = None
+        users = None
+        try:
+            with metrics.stage("collect", attendance_system.device_key) as stage:
+                await asyncio.wait_for(attendance_system.connect(), device_timeout)
+                if not attendance_system.conn:
+                    entry['error'] = attendance_system.last_error or "Connection failed"
+                    return entry, None, None
+                records = await asyncio.wait_for(
+                    attendance_system.get_raw_attendance(start_date, end_date, device_name=entry['name']),
+                    max(0.0, device_timeout - (time.monotonic() - started))
+                )
+                users = pd.DataFrame({
+                    'user_id': list(attendance_system.users.keys()),
+                    'user_name': list(attendance_system.users.values()),
+                })
+                users['device_name'] = entry['name']
+                entry['ok'] = True
+                entry['users'] = len(users)
+                entry['records'] = stage.records = 0 if records is None else len(records)
+        except asyncio.TimeoutError:
+            entry['error'] = "Timed out"
+        except Exception as e:
+            entry['error'] = str(e)
+        finally:
+            try:
+                await attendance_system.disconnect()
+            except Exception:
+                pass
+            entry['seconds'] = round(time.monotonic() - started, 3)
+        status = f"{entry['records']} records" if entry['ok'] else f"failed ({entry['error']})"
+        log.info("%s (%s): %s in %ss", entry['name'], entry['ip'], status, entry['seconds'])
+        return entry, records, users
+
+
+async def collect_async(devices, start_date=None, end_date=None, timeout=5, device_timeout=120, max_connections=256,
+                        duplicate_window=0):
+    """Fetch users and raw attendance from every device on one event loop.
+
+    At most max_connections devices are open at once; each gets
+    device_timeout seconds of wall time. Returns the same CollectionResult
+    as MultiDeviceCollector.collect, including its duplicate_window handling.
+    """
+    slots = asyncio.Semaphore(max_connections)
+    results = await asyncio.gather(*(
+        _fetch_device(device, start_date, end_date, timeout, device_timeout, slots) for device in devices
+    ))
+    report = [entry for entry, _, _ in results]
+    frames = [records for _, records, _ in results if records is not None and not records.empty]
+    user_frames = [users for _, _, users in results if users is not None and not users.empty]
+    attendance = merge_punches(frames, duplicate_window)
+    users = pd.concat(user_frames, ignore_index=True) if user_frames else pd.DataFrame(columns=['user_id', 'user_name', 'device_name'])
+    return CollectionResult(attendance, users, report)
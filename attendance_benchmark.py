@@ -0,0 +1,346 @@
+"""Benchmarks for the attendance pipeline on synthetic punch logs.
+
+Each stage is timed on its own input and then run again under tracemalloc
+for its peak Python/numpy allocation. Results are written as JSON so runs
+can be compared:
+
+    python attendance_benchmark.py --sizes 10k,100k,1M,5M --users 100,1000 --output run.json
+    python attendance_benchmark.py --sizes 10k,100k --compare run.json
+
+Stages:
+    frame       pyzk records -> timestamp-sorted punch frame (the pre-decoder path, for comparison)
+    decode      raw attendance buffer -> punch frame via the chunked AttendanceDecoder
+    raw         get_raw_attendance (buffer decode, date slice, categorical decoration)
+    pair        pair_attendance on the raw frame
+    merge       merge_punches over the raw frame split across four devices
+    table_sort  stable multi-column typed sort of the table model
+    table_page  formatting 100 table pages of 50 rows at random offsets
+    store       AttendanceStore.ingest into a fresh database, then query
+    csv         streamed CSV export of paired records
+    xlsx        streamed XLSX export (needs openpyxl, capped by --xlsx-max)
+    pdf         PDF report of paired records (capped by --pdf-max)
+    download    ZKTecoAttendance._download from the simulator (capped by --download-max)
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from struct import pack
+import numpy as np
+import pandas as pd
+from zk.attendance import Attendance
+from attendance_system import AttendanceDecoder, ZKTecoAttendance, pair_attendance
+from attendance_collector import DUPLICATE_WINDOW_SECONDS, merge_punches
+from attendance_store import AttendanceStore
+from attendance_export import export_stream
+from attendance_report import PAIRED_REPORT_COLUMNS, format_paired_columns, format_raw_columns, raw_sort_column, write_pdf_report
+from attendance_table import sort_frame
+
+DEFAULT_SIZES = "10k,100k,1M,5M"
+DEFAULT_USERS = "100,1000"
+
+
+class SyntheticDevice:
+    """Stands in for a pyzk connection holding a fixed punch log"""
+
+    def __init__(self, attendance):
+        self.attendance = attendance
+        self.records = len(attendance)
+        self._buffer = None
+
+    def get_attendance(self):
+        return self.attendance
+
+    def read_sizes(self):
+        return True
+
+    def read_with_buffer(self, command, fct=0, ext=0):
+        """The attendance log as the device's 40-byte record buffer"""
+        if self._buffer is None:
+            self._buffer = attendance_buffer(self.attendance)
+        return self._buffer, len(self._buffer)
+
+
+def records_frame(attendance):
+    """Build a timestamp-sorted punch frame column by column from pyzk Attendance records"""
+    count = len(attendance)
+    df = pd.DataFrame({
+        'user_id': [att.user_id for att in attendance],
+        'timestamp': pd.to_datetime([att.timestamp for att in attendance]),
+        'raw_status': np.fromiter((att.status for att in attendance), dtype=np.int16, count=count),
+        'punch': np.fromiter((att.punch for att in attendance), dtype=np.int16, count=count),
+    })
+    return df.sort_values('timestamp', kind='mergesort', ignore_index=True)
+
+
+def attendance_buffer(attendance):
+    """Encode pyzk Attendance records as a device attendance buffer (size header + records)"""
+    from attendance_simulator import ATTENDANCE_DTYPE, encode_times
+
+    records = np.zeros(len(attendance), dtype=ATTENDANCE_DTYPE)
+    records['user_id'] = [str(att.user_id).encode() for att in attendance]
+    records['status'] = [att.status for att in attendance]
+    records['timestamp'] = encode_times(np.array([att.timestamp for att in attendance], dtype='datetime64[s]'))
+    records['punch'] = [att.punch for att in attendance]
+    data = records.tobytes()
+    return pack('<I', len(data)) + data
+
+
+def generate_punches(count, users, days=90, seed=0, end=None):
+    """Return `count` pyzk Attendance records for `users` users over `days` days.
+
+    Check-ins cluster around 09:00 and check-outs around 17:30, with some
+    duplicate and missing punches as on a real terminal. Records come out in
+    timestamp order.
+    """
+    rng = np.random.default_rng(seed)
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = np.datetime64(end - timedelta(days=days), 's')
+    punch = rng.integers(0, 2, size=count)
+    day = rng.integers(0, days, size=count)
+    seconds = np.where(punch == 0, rng.normal(9 * 3600, 2700, size=count), rng.normal(17.5 * 3600, 3600, size=count))
+    seconds = np.clip(seconds, 0, 86399).astype(np.int64)
+    timestamps = start + (day * 86400 + seconds).astype('timedelta64[s]')
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order].astype('datetime64[us]').tolist()
+    punch = punch[order].tolist()
+    user_ids = rng.integers(1, users + 1, size=count).astype(str).tolist()
+    return [
+        Attendance(user_id, timestamp, 1, p)
+        for user_id, timestamp, p in zip(user_ids, timestamps, punch)
+    ]
+
+
+def generate_users(users):
+    return {str(uid): f"User {uid}" for uid in range(1, users + 1)}
+
+
+def parse_counts(text):
+    """Parse '10k,100k,1M' into [10000, 100000, 1000000]"""
+    counts = []
+    for item in text.split(','):
+        item = item.strip().lower()
+        scale = {'k': 1000, 'm': 1000000}.get(item[-1:], 1)
+        counts.append(int(float(item.rstrip('km')) * scale))
+    return counts
+
+
+def measure(stage, memory=True):
+    """Time stage() once, then run it again under tracemalloc for the peak"""
+    gc.collect()
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        rows = stage()
+        seconds = time.perf_counter() - started
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                stage()
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+    return seconds, peak_mb, rows
+
+
+def _stages(attendance, users, workdir, args):
+    """Build the stage callables for one (punches, users) case"""
+    system = ZKTecoAttendance("127.0.0.1")
+    system.conn = SyntheticDevice(attendance)
+    system.users = users
+    count = len(attendance)
+    with contextlib.redirect_stdout(io.StringIO()):
+        raw = system.get_raw_attendance()
+        paired = pair_attendance(raw)
+    paired['device_name'] = system.device_key
+    chunk_rows = 50000
+
+    def paired_chunks():
+        for start in range(0, len(paired), chunk_rows):
+            yield paired.iloc[start:start + chunk_rows]
+
+    def frame():
+        return len(records_frame(attendance))
+
+    buffer = system.conn.read_with_buffer(None)[0]
+
+    def decode():
+        decoder = AttendanceDecoder(count)
+        decoder.feed(buffer)
+        return len(decoder.frame())
+
+    def raw_stage():
+        return len(system.get_raw_attendance())
+
+    def pair():
+        return len(pair_attendance(raw))
+
+    def merge():
+        # Four devices' logs, interleaved in time, with cross-device duplicates dropped
+        return len(merge_punches([raw.iloc[i::4] for i in range(4)], DUPLICATE_WINDOW_SECONDS))
+
+    def table_sort():
+        # User, then newest day first, then check-in time, as from Shift+clicked headings
+        keys = [('user_id', True), ('date', False), ('check_in', True)]
+        return len(sort_frame(raw, keys, raw_sort_column))
+
+    def table_page():
+        offsets = random.Random(0).sample(range(max(1, len(raw) - 50)), min(100, max(1, len(raw) - 50)))
+        for offset in offsets:
+            format_raw_columns(raw.iloc[offset:offset + 50])
+        return 50 * len(offsets)
+
+    def store():
+        path = os.path.join(workdir, f"bench-{time.perf_counter_ns()}.db")
+        db = AttendanceStore(path)
+        try:
+            db.ingest(system.device_key, attendance, record_count=count)
+            return len(db.query(system.device_key))
+        finally:
+            db.close()
+            os.remove(path)
+
+    def export(extension):
+        def run():
+            path = os.path.join(workdir, f"bench.{extension}")
+            rows = export_stream(path, paired_chunks())
+            os.remove(path)
+            return rows
+        return run
+
+    def pdf():
+        path = os.path.join(workdir, "bench.pdf")
+        write_pdf_report(path, "Benchmark", PAIRED_REPORT_COLUMNS, paired, format_paired_columns)
+        os.remove(path)
+        return len(paired)
+
+    stages = [
+        ('frame', frame), ('decode', decode), ('raw', raw_stage), ('pair', pair), ('merge', merge), ('table_sort', table_sort),
+        ('table_page', table_page), ('store', store), ('csv', export('csv')),
+    ]
+    if len(paired) <= args.xlsx_max:
+        try:
+            import openpyxl  # noqa: F401
+            stages.append(('xlsx', export('xlsx')))
+        except ImportError:
+            pass
+    if len(paired) <= args.pdf_max:
+        stages.append(('pdf', pdf))
+    if count <= args.download_max:
+        stages.append(('download', lambda: _download(count, len(users))))
+    return stages
+
+
+def _download(count, users):
+    """Download and decode `count` punches from a local simulator, as a sync does"""
+    from attendance_simulator import start_simulator
+
+    server = start_simulator(port=0, users=users, punches=count)
+    try:
+        system = ZKTecoAttendance("127.0.0.1", port=server.server_address[1], timeout=60, ommit_ping=True)
+        system.connect()
+        try:
+            return len(system._download())
+        finally:
+            system.disconnect()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run(args):
+    results = []
+    only = set(args.stages.split(',')) if args.stages else None
+    with tempfile.TemporaryDirectory() as workdir:
+        for user_count in parse_counts(args.users):
+            users = generate_users(user_count)
+            for count in parse_counts(args.sizes):
+                attendance = generate_punches(count, user_count, days=args.days)
+                for name, stage in _stages(attendance, users, workdir, args):
+                    if only and name not in only:
+                        continue
+                    seconds, peak_mb, rows = measure(stage, memory=not args.no_memory)
+                    result = {
+                        'stage': name, 'punches': count, 'users': user_count, 'rows': rows,
+                        'seconds': round(seconds, 4), 'peak_mb': None if peak_mb is None else round(peak_mb, 2),
+                    }
+                    results.append(result)
+                    peak = "-" if peak_mb is None else f"{peak_mb:.1f} MB"
+                    print(f"{name:<11} punches={count:<9} users={user_count:<6} "
+                          f"{seconds:9.3f} s  peak={peak}", flush=True)
+                del attendance
+    return results
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Print stages slower than `threshold` x the baseline; return how many regressed"""
+    with open(baseline_path) as f:
+        baseline = {
+            (r['stage'], r['punches'], r['users']): r for r in json.load(f)['results']
+        }
+    regressions = 0
+    for result in results:
+        before = baseline.get((result['stage'], result['punches'], result['users']))
+        if not before or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        if ratio > threshold:
+            regressions += 1
+            print(f"REGRESSION {result['stage']} punches={result['punches']} users={result['users']}: "
+                  f"{before['seconds']:.3f} s -> {result['seconds']:.3f} s ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the attendance pipeline on synthetic punches")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="punch counts, e.g. 10k,100k,1M,5M")
+    parser.add_argument("--users", default=DEFAULT_USERS, help="user counts, e.g. 100,1000")
+    parser.add_argument("--days", type=int, default=90, help="days of history the punches span")
+    parser.add_argument("--stages", help="comma-separated subset of stages to run")
+    parser.add_argument("--pdf-max", type=int, default=100000, help="largest paired row count for the PDF stage")
+    parser.add_argument("--xlsx-max", type=int, default=1000000, help="largest paired row count for the XLSX stage")
+    parser.add_argument("--download-max", type=int, default=100000, help="largest punch count for the download stage")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, "w") as f:
+        json.dump({'metadata': _metadata(), 'results': results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
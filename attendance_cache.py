@@ -0,0 +1,74 @@
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+def frame_bytes(frame):
+    """Approximate memory held by a DataFrame, including its text and categories"""
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache:
+    """Size-bounded LRU cache of attendance frames.
+
+    Keys are tuples whose first item is the device key, e.g.
+    ``(device_key, 'paired', start, end, version)``, where version is a
+    marker such as the device's record count, so a changed log simply
+    misses. Once the cached frames exceed max_bytes the least recently used
+    ones are evicted; a frame larger than max_bytes is not cached at all.
+    get() returns a shallow copy, so callers may add or replace columns
+    without touching the cached frame.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (frame, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[0].copy(deep=False)
+
+    def put(self, key, frame):
+        size = frame_bytes(frame)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                log.debug("Not caching %s: %d bytes exceeds the cache size", key[1:], size)
+                return
+            self._entries[key] = (frame, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                evicted, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                log.debug("Evicted cached %s for %s", evicted[1:], evicted[0])
+
+    def invalidate(self, device_key):
+        """Drop every cached result for one device"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == device_key]:
+                self.bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
@@ -0,0 +1,240 @@
+"""Headless command line and collector daemon.
+
+Runs without a display: it never imports tkinter, tkcalendar or fpdf.
+
+    python attendance_cli.py collect --start 2026-09-01 --end 2026-09-30 --output september.csv
+    python attendance_cli.py daemon --interval 300 --output-dir exports --metrics-file attendance.prom
+    python attendance_cli.py monthly --month 2026-09 --output payroll-2026-09.csv
+    python attendance_cli.py archive --archive-dir /var/lib/attendance/archive
+
+Devices come from devices.json (the file the GUI saves). Punches are
+synced into the local store, and outputs are written from the store.
+The daemon stops cleanly on SIGTERM or SIGINT, so it can run as a systemd
+service.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+import pandas as pd
+from attendance_collector import MultiDeviceCollector, load_devices, merge_punches
+from attendance_export import export_stream
+from attendance_metrics import metrics
+from attendance_store import AttendanceStore
+from attendance_system import ZKTecoAttendance, pair_attendance
+
+log = logging.getLogger("attendance_cli")
+
+
+def _date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def _device_name(device):
+    return device.get("name") or f"Device_{device['ip']}"
+
+
+def _stored_system(device, store):
+    return ZKTecoAttendance(device['ip'], port=int(device.get('port', 4370)), store=store)
+
+
+def iter_stored(devices, store, start_date, end_date, paired=True):
+    """Yield one frame per device from the store: paired rows, or raw punches"""
+    for device in devices:
+        records = _stored_system(device, store).get_stored_attendance(
+            start_date, end_date, device_name=_device_name(device)
+        )
+        if records is None:
+            continue
+        if paired:
+            records = pair_attendance(records)
+            records['device_name'] = _device_name(device)
+        if not records.empty:
+            yield records
+
+
+def write_output(path, devices, store, start_date, end_date, paired=True, duplicate_window=0):
+    """Write a CSV or XLSX file of stored records, replacing path atomically.
+
+    Raw punches from all devices are merged into one timeline; with
+    duplicate_window, repeats within that many seconds are dropped.
+    """
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{ext}"
+    if paired:
+        chunks = iter_stored(devices, store, start_date, end_date, paired=True)
+    else:
+        merged = merge_punches(list(iter_stored(devices, store, start_date, end_date, paired=False)),
+                               duplicate_window)
+        chunks = [] if merged is None else [merged]
+    rows = export_stream(tmp, chunks)
+    if not rows:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return 0
+    os.replace(tmp, path)
+    return rows
+
+
+def sync_devices(devices, store, args):
+    collector = MultiDeviceCollector(devices, max_workers=args.workers, timeout=args.timeout,
+                                     device_timeout=args.device_timeout, store=store)
+    report = collector.sync()
+    failed = [entry for entry in report if not entry['ok']]
+    log.log(logging.ERROR if failed else logging.INFO, "Synced %d/%d devices, %d new records%s",
+            len(report) - len(failed), len(report), sum(entry['records'] for entry in report),
+            "; failed: " + ", ".join(f"{entry['name']} ({entry['error']})" for entry in failed) if failed else "")
+    return report
+
+
+def cmd_collect(args, devices, store):
+    report = sync_devices(devices, store, args)
+    if args.output:
+        end_date = args.end or date.today()
+        start_date = args.start or end_date
+        rows = write_output(args.output, devices, store, start_date, end_date, paired=not args.raw,
+                            duplicate_window=args.duplicate_window)
+        log.info("Wrote %d rows to %s", rows, args.output)
+    return 1 if any(not entry['ok'] for entry in report) else 0
+
+
+def cmd_daemon(args, devices, store):
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    log.info("Collector daemon started: %d devices every %ss", len(devices), args.interval)
+    failed_cycles = 0
+    while not stop.is_set():
+        started = time.monotonic()
+        ok = False
+        try:
+            # Re-read the device list each cycle so edits apply without a restart
+            devices = load_devices(args.devices) or devices
+            ok = all(entry['ok'] for entry in sync_devices(devices, store, args))
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                end_date = date.today()
+                start_date = end_date - timedelta(days=args.days - 1)
+                kind = "raw" if args.raw else "attendance"
+                path = os.path.join(args.output_dir, f"{kind}_{end_date:%Y%m%d}.{args.format}")
+                write_output(path, devices, store, start_date, end_date, paired=not args.raw,
+                             duplicate_window=args.duplicate_window)
+            if args.metrics_file:
+                metrics.write_text(args.metrics_file)
+        except Exception:
+            log.exception("Collection cycle failed")
+            ok = False
+        failed_cycles = 0 if ok else failed_cycles + 1
+        if args.max_failed_cycles and failed_cycles >= args.max_failed_cycles:
+            # Exit non-zero so the service manager sees the broken site
+            log.error("Stopping after %d failed collection cycles in a row", failed_cycles)
+            return 1
+        stop.wait(max(0, args.interval - (time.monotonic() - started)))
+    log.info("Collector daemon stopped")
+    return 0
+
+
+def cmd_monthly(args, devices, store):
+    keys = [f"{device['ip']}:{int(device.get('port', 4370))}" for device in devices]
+    frames = [store.monthly_summary(key, args.month, args.month) for key in keys]
+    summary = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if summary.empty:
+        log.info("No summaries for %s", args.month)
+        return 0
+    names = {key: _device_name(device) for key, device in zip(keys, devices)}
+    summary['device'] = summary['device'].map(names)
+    if args.output:
+        rows = export_stream(args.output, [summary])
+        log.info("Wrote %d rows to %s", rows, args.output)
+    else:
+        summary.to_csv(sys.stdout, index=False)
+    return 0
+
+
+def cmd_archive(args, devices, store):
+    failed = 0
+    for device in devices:
+        system = ZKTecoAttendance(device['ip'], port=int(device.get('port', 4370)), timeout=args.timeout,
+                                  store=store, ommit_ping=bool(device.get('ommit_ping', False)))
+        try:
+            system.connect()
+            if not system.conn:
+                raise ConnectionError(system.last_error or "Connection failed")
+            manifest = system.archive_and_purge(args.archive_dir, verify_download=not args.no_verify_download)
+            if manifest:
+                log.info("%s: archived %d records to %s", _device_name(device), manifest['records'], manifest['path'])
+        except Exception as e:
+            failed += 1
+            log.error("%s: archive failed, device log left as is (%s)", _device_name(device), e)
+        finally:
+            system.disconnect()
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless ZKTeco attendance collector")
+    parser.add_argument("--devices", default="devices.json", help="device list saved by the GUI")
+    parser.add_argument("--db", default="attendance.db", help="local attendance store")
+    parser.add_argument("--timeout", type=int, default=5, help="socket timeout per device (seconds)")
+    parser.add_argument("--device-timeout", type=int, default=120, help="wall-clock limit per device")
+    parser.add_argument("--workers", type=int, default=8, help="devices pulled in parallel")
+    parser.add_argument("--log-level", default="INFO")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    collect = commands.add_parser("collect", help="sync every device once and optionally write a file")
+    collect.add_argument("--start", type=_date, help="first day to export (YYYY-MM-DD, default: --end)")
+    collect.add_argument("--end", type=_date, help="last day to export (default: today)")
+    collect.add_argument("--output", help="CSV or XLSX file to write")
+    collect.add_argument("--raw", action="store_true", help="export raw punches instead of paired days")
+    collect.add_argument("--duplicate-window", type=int, default=0,
+                         help="with --raw, drop a user's repeat punches within this many seconds across devices")
+    collect.set_defaults(handler=cmd_collect)
+
+    daemon = commands.add_parser("daemon", help="sync on a schedule until stopped")
+    daemon.add_argument("--interval", type=int, default=300, help="seconds between pulls")
+    daemon.add_argument("--output-dir", help="write the trailing --days of records here after each pull")
+    daemon.add_argument("--days", type=int, default=1, help="days covered by each output file")
+    daemon.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    daemon.add_argument("--raw", action="store_true", help="export raw punches instead of paired days")
+    daemon.add_argument("--duplicate-window", type=int, default=0,
+                        help="with --raw, drop a user's repeat punches within this many seconds across devices")
+    daemon.add_argument("--metrics-file", help="Prometheus text file refreshed after each pull")
+    daemon.add_argument("--max-failed-cycles", type=int, default=0,
+                        help="exit with status 1 after this many cycles in a row with a failed device (0: never)")
+    daemon.set_defaults(handler=cmd_daemon)
+
+    monthly = commands.add_parser("monthly", help="write per-user monthly summaries from the store")
+    monthly.add_argument("--month", default=f"{date.today():%Y-%m}", help="YYYY-MM")
+    monthly.add_argument("--output", help="CSV or XLSX file (default: stdout)")
+    monthly.set_defaults(handler=cmd_monthly)
+
+    archive = commands.add_parser("archive", help="archive each device's log to disk, verify it, then clear the device")
+    archive.add_argument("--archive-dir", default="archive", help="directory for the archived logs")
+    archive.add_argument("--no-verify-download", action="store_true",
+                         help="skip the second download compared against the archive before clearing")
+    archive.set_defaults(handler=cmd_archive)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if getattr(args, 'metrics_file', None):
+        metrics.enable()
+    devices = load_devices(args.devices)
+    if not devices:
+        log.error("No devices in %s", args.devices)
+        return 2
+    store = AttendanceStore(args.db)
+    try:
+        return args.handler(args, devices, store)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
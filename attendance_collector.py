@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from attendance_metrics import metrics
+from attendance_system import ZKTecoAttendance
+
+CATEGORY_COLUMNS = ['user_id', 'user_name', 'status', 'device_name']
+DUPLICATE_WINDOW_SECONDS = 60  # Default window for merge_punches
+
+log = logging.getLogger(__name__)
+
+
+def device_entry(device):
+    """Blank per-device report entry: name, ip, port, ok, records, users, seconds, error"""
+    return {
+        'name': device.get("name") or f"Device_{device['ip']}",
+        'ip': device['ip'],
+        'port': int(device.get('port', 4370)),
+        'ok': False,
+        'records': 0,
+        'users': 0,
+        'seconds': 0.0,
+        'error': None,
+    }
+
+
+def load_devices(path="devices.json"):
+    """Load the saved device list, returning [] if missing or unreadable"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        try:
+            return json.load(f)
+        except Exception:
+            return []
+
+
+class CollectionResult:
+    """Merged output of a multi-device collection run"""
+
+    def __init__(self, attendance, users, report):
+        self.attendance = attendance  # Raw punches from every device, tagged with device_name
+        self.users = users  # user_id, user_name, device_name for every device
+        self.report = report  # One dict per device: name, ip, port, ok, records, users, seconds, error
+
+    @property
+    def failed(self):
+        return [r for r in self.report if not r['ok']]
+
+
+class MultiDeviceCollector:
+    """Fetch users and attendance from many devices in parallel.
+
+    A bounded thread pool runs one fetch per device. Each device uses its
+    socket timeout for every protocol exchange, and the whole run waits at
+    most ``device_timeout`` seconds per wave of workers, so total wall time
+    stays close to the slowest single device. With duplicate_window set,
+    collect() drops repeated punches across devices (see merge_punches).
+    """
+
+    def __init__(self, devices, max_workers=8, timeout=5, device_timeout=120, store=None, duplicate_window=0):
+        self.devices = devices
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.device_timeout = device_timeout
+        self.store = store
+        self.duplicate_window = duplicate_window
+
+    def _system(self, device, entry):
+        # ommit_ping is for devices (or simulators) that do not answer ICMP
+        return ZKTecoAttendance(entry['ip'], port=entry['port'], timeout=self.timeout, store=self.store,
+                                ommit_ping=bool(device.get('ommit_ping', False)))
+
+    def _fetch_device(self, device, start_date, end_date):
+        started = time.monotonic()
+        entry = device_entry(device)
+        name = entry['name']
+        attendance_system = self._system(device, entry)
+        records = None
+        users = None
+        stage = metrics.stage("collect", attendance_system.device_key)
+        try:
+            with stage:
+                attendance_system.connect()
+                if not attendance_system.conn:
+                    entry['error'] = attendance_system.last_error or "Connection failed"
+                    return entry, None, None
+                users = pd.DataFrame({
+                    'user_id': list(attendance_system.users.keys()),
+                    'user_name': list(attendance_system.users.values()),
+                })
+                users['device_name'] = name
+                records = attendance_system.get_raw_attendance(start_date, end_date, device_name=name)
+                entry['ok'] = True
+                entry['users'] = len(users)
+                entry['records'] = stage.records = 0 if records is None else len(records)
+        except Exception as e:
+            entry['error'] = str(e)
+        finally:
+            try:
+                attendance_system.disconnect()
+            except Exception:
+                pass
+            entry['seconds'] = round(time.monotonic() - started, 3)
+        return entry, records, users
+
+    def _sync_device(self, device):
+        started = time.monotonic()
+        entry = device_entry(device)
+        attendance_system = self._system(device, entry)
+        try:
+            attendance_system.connect()
+            if not attendance_system.conn:
+                entry['error'] = attendance_system.last_error or "Connection failed"
+                return entry,
+            entry['records'] = attendance_system.sync()
+            entry['users'] = len(attendance_system.users)
+            entry['ok'] = True
+        except Exception as e:
+            entry['error'] = str(e)
+        finally:
+            try:
+                attendance_system.disconnect()
+            except Exception:
+                pass
+            entry['seconds'] = round(time.monotonic() - started, 3)
+        return entry,
+
+    def _run_all(self, work, describe):
+        """Run work(device) for every device in the pool.
+
+        work returns a tuple whose first item is the device's report entry.
+        Returns those tuples in device-list order, with a failed entry for
+        each device that did not finish in time, and logs one line per
+        device where describe(entry) says what it achieved.
+        """
+        results = []
+        workers = max(1, min(self.max_workers, len(self.devices)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {executor.submit(work, device): device for device in self.devices}
+            # Devices queue behind the pool, so allow one timeout per wave of workers
+            waves = max(1, -(-len(futures) // workers))
+            done, not_done = wait(futures, timeout=self.device_timeout * waves)
+            for future in done:
+                results.append(future.result())
+            for future in not_done:
+                future.cancel()
+                entry = device_entry(futures[future])
+                entry['seconds'] = float(self.device_timeout)
+                entry['error'] = "Timed out"
+                results.append((entry,))
+        finally:
+            # Do not block on stragglers; their sockets time out on their own
+            executor.shutdown(wait=False)
+
+        order = {d.get("name") or f"Device_{d['ip']}": i for i, d in enumerate(self.devices)}
+        results.sort(key=lambda r: order.get(r[0]['name'], len(order)))
+        for result in results:
+            entry = result[0]
+            status = describe(entry) if entry['ok'] else f"failed ({entry['error']})"
+            log.info("%s (%s): %s in %ss", entry['name'], entry['ip'], status, entry['seconds'])
+        return results
+
+    def collect(self, start_date=None, end_date=None):
+        """Fetch from every device and return a CollectionResult"""
+        results = self._run_all(
+            lambda device: self._fetch_device(device, start_date, end_date),
+            lambda entry: f"{entry['records']} records"
+        )
+        report = [result[0] for result in results]
+        frames = [r[1] for r in results if len(r) > 1 and r[1] is not None and not r[1].empty]
+        user_frames = [r[2] for r in results if len(r) > 2 and r[2] is not None and not r[2].empty]
+        attendance = merge_punches(frames, self.duplicate_window)
+        users = pd.concat(user_frames, ignore_index=True) if user_frames else pd.DataFrame(columns=['user_id', 'user_name', 'device_name'])
+        return CollectionResult(attendance, users, report)
+
+    def sync(self):
+        """Pull new punches from every device into the store; return the report entries.
+
+        Each entry's records is the number of new punches stored.
+        """
+        if self.store is None:
+            raise ValueError("sync() needs an AttendanceStore")
+        results = self._run_all(self._sync_device, lambda entry: f"{entry['records']} new records")
+        return [result[0] for result in results]
+
+
+def merge_frames(frames):
+    """Concatenate raw attendance frames from several devices, sorted by timestamp.
+
+    Each device frame is already in time order, so the stable sort works as
+    a k-way merge: timsort finds the k sorted runs and merges them in
+    O(n log k).
+    """
+    if not frames:
+        return None
+    merged = pd.concat(frames, ignore_index=True)
+    # Concatenating categoricals with different categories yields object columns
+    for col in CATEGORY_COLUMNS:
+        if col in merged:
+            merged[col] = merged[col].astype('category')
+    return merged.sort_values('timestamp', kind='mergesort', ignore_index=True)
+
+
+def merge_punches(frames, window_seconds=DUPLICATE_WINDOW_SECONDS, match_punch=True):
+    """k-way merge raw punch frames from several devices and drop duplicate punches.
+
+    A punch is a duplicate when the same user punched at most
+    window_seconds earlier on any device (with match_punch, only a punch of
+    the same kind counts), so a burst of repeats keeps only its first punch.
+    After the merge one stable sort by user brings each user's punches
+    together in time order, and each is compared with its neighbour only.
+    Returns the merged frame in timestamp order, or None without frames;
+    window_seconds=0 keeps every punch.
+    """
+    merged = merge_frames(frames)
+    if merged is None or merged.empty or not window_seconds:
+        return merged
+    key = merged['user_id'].cat.codes.values.astype(np.int64)
+    if match_punch:
+        # Punch codes are single bytes on the device
+        key = key * 256 + (merged['punch'].values.astype(np.int64) & 0xFF)
+    if key.max() < np.iinfo(np.int16).max:
+        key = key.astype(np.int16)  # Narrow keys are radix-sorted
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    ts = merged['timestamp'].values[order]
+    repeat = np.zeros(len(order), dtype=bool)
+    repeat[1:] = (key[1:] == key[:-1]) & (ts[1:] - ts[:-1] <= np.timedelta64(int(window_seconds * 1000000), 'us'))
+    keep = np.ones(len(order), dtype=bool)
+    keep[order[repeat]] = False
+    dropped = len(keep) - int(keep.sum())
+    if dropped:
+        log.info("Dropped %d duplicate punches within %ss", dropped, window_seconds)
+    return merged[keep].reset_index(drop=True)
+
+
+def merge_sources(sources, start_date=None, end_date=None, window_seconds=DUPLICATE_WINDOW_SECONDS,
+                  match_punch=True):
+    """Merged, de-duplicated raw punches from several connected ZKTecoAttendance sources"""
+    frames = [source.get_raw_attendance(start_date, end_date) for source in sources]
+    return merge_punches([f for f in frames if f is not None and not f.empty], window_seconds, match_punch)
+
+
+def collect_all(devices_file="devices.json", start_date=None, end_date=None, **kwargs):
+    """Collect from every device saved in devices_file"""
+    return MultiDeviceCollector(load_devices(devices_file), **kwargs).collect(start_date, end_date)
@@ -0,0 +1,85 @@
+import os
+import pandas as pd
+from attendance_metrics import metrics
+
+
+def export_csv_stream(filename, chunks, progress=None, should_stop=None):
+    """Write an iterable of DataFrames to one CSV file as they arrive.
+
+    The header comes from the first chunk; each chunk is appended and then
+    dropped, so memory is bounded by the largest chunk. Returns the number of
+    rows written, or None if should_stop() interrupted the export (the
+    partial file is removed).
+    """
+    rows = 0
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        for chunk in chunks:
+            if should_stop and should_stop():
+                break
+            chunk.to_csv(f, index=False, header=rows == 0)
+            rows += len(chunk)
+            if progress:
+                progress(f"Exported {rows} records...")
+        else:
+            return rows
+    os.remove(filename)
+    return None
+
+
+def _excel_value(value):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def export_xlsx_stream(filename, chunks, progress=None, should_stop=None):
+    """Write an iterable of DataFrames to an XLSX file using openpyxl's write-only mode.
+
+    Write-only worksheets stream rows to disk, so memory stays bounded by
+    the current chunk. Same return convention as export_csv_stream.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Attendance")
+    rows = 0
+    stopped = False
+    for chunk in chunks:
+        if should_stop and should_stop():
+            stopped = True
+            break
+        if rows == 0:
+            sheet.append(list(chunk.columns))
+        # Datetime columns become Python datetimes once per column, not per cell
+        columns = []
+        for col in chunk.columns:
+            values = chunk[col]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                values = values.astype(object).where(values.notna(), None)
+            columns.append(values.tolist())
+        for row in zip(*columns):
+            sheet.append([_excel_value(value) for value in row])
+        rows += len(chunk)
+        if progress:
+            progress(f"Exported {rows} records...")
+    if stopped:
+        workbook.close()
+        return None
+    workbook.save(filename)
+    return rows
+
+
+def export_stream(filename, chunks, progress=None, should_stop=None):
+    """Pick the CSV or XLSX writer from the file extension"""
+    xlsx = filename.lower().endswith(".xlsx")
+    with metrics.stage("export_xlsx" if xlsx else "export_csv") as stage:
+        writer = export_xlsx_stream if xlsx else export_csv_stream
+        rows = writer(filename, chunks, progress, should_stop)
+        if rows is not None:
+            stage.records = rows
+            stage.bytes = os.path.getsize(filename)
+    return rows
@@ -1,10 +1,37 @@
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from tkcalendar import DateEntry
-from attendance_system import ZKTecoAttendance
-import pandas as pd
+from attendance_jobs import JobRunner
+from attendance_metrics import configure_from_env, metrics
 import json
+import logging
 import os
+import queue
+
+# pandas, numpy, pyzk, tkcalendar and the modules built on them are imported
+# by load_modules() on a worker thread once the window is up, and imported
+# locally where they are used.
+
+# The window should appear within this many seconds of process start
+STARTUP_TARGET_SECONDS = 1.0
+
+_STARTED = time.perf_counter()
+
+log = logging.getLogger(__name__)
+
+
+def load_modules():
+    """Import the heavy dependencies so later local imports are cache hits"""
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import tkcalendar  # noqa: F401
+    import attendance_collector  # noqa: F401
+    import attendance_export  # noqa: F401
+    import attendance_report  # noqa: F401
+    import attendance_session  # noqa: F401
+    import attendance_store  # noqa: F401
+    import attendance_table  # noqa: F401
+
 
 class AttendanceGUI:
     def __init__(self, root):
@@ -12,15 +39,12 @@ class AttendanceGUI:
         self.root.title("ZKTeco Attendance System")
         self.root.geometry("1300x600")
         
-        # Load saved devices (move this to the very start of __init__)
+        # Devices, the store and the sessions are set up by _start_background_setup
         self.devices_file = "devices.json"
         self.saved_devices = []
-        if os.path.exists(self.devices_file):
-            with open(self.devices_file, "r") as f:
-                try:
-                    self.saved_devices = json.load(f)
-                except Exception:
-                    self.saved_devices = []
+        self.attendance_store = None
+        self.session_manager = None
+        self.table = None
 
         # Create main frame
         main_frame = ttk.Frame(root, padding="10")
@@ -58,22 +82,26 @@ class AttendanceGUI:
         device_mgmt_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
         ttk.Label(device_mgmt_frame, text="Select Device:").grid(row=0, column=0, padx=5, pady=2)
         self.selected_device_var = tk.StringVar()
-        self.device_dropdown = ttk.Combobox(device_mgmt_frame, textvariable=self.selected_device_var, values=[d["name"] for d in self.saved_devices], state="readonly", width=18)
+        self.device_dropdown = ttk.Combobox(device_mgmt_frame, textvariable=self.selected_device_var, values=[], state="readonly", width=18)
         self.device_dropdown.grid(row=0, column=1, padx=5, pady=2)
         self.device_dropdown.bind("<<ComboboxSelected>>", self.on_device_selected)
         self.edit_device_button = ttk.Button(device_mgmt_frame, text="Edit", command=self.edit_selected_device, width=6)
         self.edit_device_button.grid(row=0, column=2, padx=2, pady=2)
         self.delete_device_button = ttk.Button(device_mgmt_frame, text="Delete", command=self.delete_selected_device, width=6)
         self.delete_device_button.grid(row=0, column=3, padx=2, pady=2)
+        self.collect_all_button = ttk.Button(device_mgmt_frame, text="Collect All Devices", command=self.collect_all_devices)
+        self.collect_all_button.grid(row=0, column=4, padx=5, pady=2)
         
         # Date filter frame
         date_frame = ttk.LabelFrame(main_frame, text="Date Filter", padding="10 10 10 10")
         date_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10, padx=10, ipadx=5, ipady=5)
+        self.date_frame = date_frame
         ttk.Label(date_frame, text="Start Date:").grid(row=0, column=0, padx=5, pady=2)
-        self.start_date = DateEntry(date_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
+        # Placeholders until tkcalendar has loaded; replaced by DateEntry widgets
+        self.start_date = ttk.Entry(date_frame, width=14, state=tk.DISABLED)
         self.start_date.grid(row=0, column=1, padx=5, pady=2)
         ttk.Label(date_frame, text="End Date:").grid(row=0, column=2, padx=5, pady=2)
-        self.end_date = DateEntry(date_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
+        self.end_date = ttk.Entry(date_frame, width=14, state=tk.DISABLED)
         self.end_date.grid(row=0, column=3, padx=5, pady=2)
         self.export_button = ttk.Button(date_frame, text="Export to CSV", command=self.export_records, state=tk.DISABLED)
         self.export_button.grid(row=0, column=4, padx=5, pady=2)
@@ -81,6 +109,10 @@ class AttendanceGUI:
         self.export_pdf_button.grid(row=0, column=5, padx=5, pady=2)
         self.show_raw_button = ttk.Button(date_frame, text="Get Attendance Logs", command=self.show_raw_logs, state=tk.DISABLED)
         self.show_raw_button.grid(row=0, column=6, padx=5, pady=2)
+        self.live_button = ttk.Button(date_frame, text="Live", command=self.start_live_mode, state=tk.DISABLED)
+        self.live_button.grid(row=0, column=7, padx=5, pady=2)
+        self.cancel_button = ttk.Button(date_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=8, padx=5, pady=2)
 
         # Add summary panel below date_frame, above table
         self.summary_frame = ttk.Frame(main_frame, padding="5 5 5 5")
@@ -94,7 +126,7 @@ class AttendanceGUI:
 
         # Status label above the table for feedback
         self.status_var = tk.StringVar()
-        self.status_var.set("Not connected")
+        self.status_var.set("Loading...")
         self.status_label = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor="w", padding="5 5 5 5")
         # Move status label below the table for better visibility
         self.status_label.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
@@ -116,7 +148,7 @@ class AttendanceGUI:
         tree_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.N, tk.S, tk.E, tk.W), padx=30, pady=10)
         
         # Create scrollbars
-        y_scrollbar = ttk.Scrollbar(tree_frame)
+        y_scrollbar = self.y_scrollbar = ttk.Scrollbar(tree_frame)
         y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         x_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL)
@@ -125,11 +157,9 @@ class AttendanceGUI:
         # Create Treeview
         columns = ('user_id', 'user_name', 'date', 'check_in', 'check_out', 'device_name')
         self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings',
-                                yscrollcommand=y_scrollbar.set,
                                 xscrollcommand=x_scrollbar.set)
         
         # Configure scrollbars
-        y_scrollbar.config(command=self.tree.yview)
         x_scrollbar.config(command=self.tree.xview)
         
         # Configure columns
@@ -148,38 +178,94 @@ class AttendanceGUI:
         self.tree.column('device_name', width=120)
         
         self.tree.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+        # Define tag styles for row colors
+        self.tree.tag_configure('checkin', background='#d4f7d4')  # light green
+        self.tree.tag_configure('checkout', background='#d4e6f7')  # light blue
         # Bind double-click event to treeview for user details popup (after treeview is created)
         self.tree.bind('<Double-1>', self.on_row_double_click)
         
-        # Enable column resizing
+        # Enable column resizing; a heading click sorts, Shift+click adds a sort column
+        self._heading_text = {col: self.tree.heading(col)['text'] for col in columns}
+        self._shift_click = False
+        self.tree.bind('<Button-1>', lambda e: setattr(self, '_shift_click', bool(e.state & 0x1)), add='+')
         for col in columns:
-            self.tree.heading(col, text=self.tree.heading(col)['text'], command=lambda _col=col: self.sort_by_column(_col, False))
+            self.tree.heading(col, text=self._heading_text[col], command=lambda _col=col: self.sort_by_column(_col, self._shift_click))
             self.tree.column(col, width=self.tree.column(col)['width'], minwidth=50, stretch=True)
         
-        # Initialize attendance system
+        self.session = None
         self.attendance_system = None
-        
+        # Device and report work runs off the Tk thread
+        self.jobs = JobRunner(self.root, on_busy_change=lambda busy: self._update_buttons(busy))
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self._start_background_setup()
+
+    def _start_background_setup(self):
+        """Import dependencies, open the store and read devices.json on a worker thread.
+
+        Buttons stay disabled while the startup job runs; _finish_setup then
+        builds the widgets that need those modules on the Tk thread.
+        """
+        def work(job):
+            with metrics.stage("startup_load"):
+                load_modules()
+                from attendance_collector import load_devices
+                from attendance_store import AttendanceStore
+                # Local punch store shared by all devices (incremental sync)
+                return AttendanceStore("attendance.db"), load_devices(self.devices_file)
+
+        def on_error(e):
+            messagebox.showerror("Startup Error", str(e))
+            self.status_var.set("Startup failed")
+
+        self._start_job("startup", work, self._finish_setup, on_error)
+
+    def _finish_setup(self, result):
+        from tkcalendar import DateEntry
+        from attendance_cache import ResultCache
+        from attendance_report import raw_sort_column
+        from attendance_session import SessionManager
+        from attendance_table import VirtualTable
+
+        self.attendance_store, self.saved_devices = result
+        self.device_dropdown['values'] = [d["name"] for d in self.saved_devices]
+        # Date pickers take over the placeholders' grid cells
+        self.start_date.destroy()
+        self.end_date.destroy()
+        self.start_date = DateEntry(self.date_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
+        self.start_date.grid(row=0, column=1, padx=5, pady=2)
+        self.end_date = DateEntry(self.date_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
+        self.end_date.grid(row=0, column=3, padx=5, pady=2)
+        # The vertical scrollbar follows the backing DataFrame, not the Treeview items
+        self.table = VirtualTable(self.tree, self.y_scrollbar, self._format_raw_rows, sort_column=raw_sort_column)
+        # Initialize attendance system; sessions are reused across connects, and
+        # Show Logs and the exports share one cache of downloaded and paired results
+        self.session_manager = SessionManager(store=self.attendance_store, cache=ResultCache())
+        self.status_var.set("Not connected")
+        self._update_buttons()
+        log.info("Ready in %.2fs", time.perf_counter() - _STARTED)
+
     def connect_device(self):
         try:
-            # If already connected, disconnect first
-            if hasattr(self, 'attendance_system') and self.attendance_system and self.attendance_system.conn:
-                self.attendance_system.disconnect()
+            # If already connected, switch away; the old session stays pooled
+            if self.session and self.session.is_alive:
                 # Clear the table and summary
-                for item in self.tree.get_children():
-                    self.tree.delete(item)
-                self.checkin_var.set("Total Check-ins: 0")
-                self.checkout_var.set("Total Check-outs: 0")
-                self.unique_users_var.set("Unique Users: 0")
+                self.table.clear()
+                self._set_summary(0, 0, set())
                 self.status_var.set("Not connected")
-                self.connect_button.config(state=tk.NORMAL)
-                self.disconnect_button.config(state=tk.DISABLED)
             ip = self.ip_var.get()
             port = int(self.port_var.get())
             device_name = self.device_name_var.get().strip() or f"Device_{ip}"
             self.current_device_name = device_name
-            self.attendance_system = ZKTecoAttendance(ip, port=port)
-            self.attendance_system.connect()
-            if self.attendance_system.conn:
+            session = self.session_manager.get(ip, port)
+        except Exception as e:
+            messagebox.showerror("Connection Error", str(e))
+            self.status_var.set("Connection failed")
+            return
+
+        def on_done(connected):
+            self.session = session if connected else None
+            self.attendance_system = session.attendance_system if connected else None
+            if connected:
                 # Save device info
                 device_info = {"name": device_name, "ip": ip, "port": port}
                 devices_file = "devices.json"
@@ -196,61 +282,108 @@ class AttendanceGUI:
                     with open(devices_file, "w") as f:
                         json.dump(devices, f, indent=2)
                 self.status_var.set(f"Connected to {ip}")
-                self.connect_button.config(state=tk.DISABLED)
-                self.disconnect_button.config(state=tk.NORMAL)
-                self.show_raw_button.config(state=tk.NORMAL)
-                self.export_button.config(state=tk.NORMAL)
-                self.export_pdf_button.config(state=tk.NORMAL)
             else:
-                self.status_var.set("Connection failed")
-        except Exception as e:
+                self.status_var.set(f"Connection failed: {session.last_error}")
+            self._update_buttons()
+
+        def on_error(e):
             messagebox.showerror("Connection Error", str(e))
             self.status_var.set("Connection failed")
 
+        self.status_var.set(f"Connecting to {ip}...")
+        self._start_job("connect", lambda job: session.open(retries=1), on_done, on_error)
+
     def disconnect_device(self):
-        if hasattr(self, 'attendance_system') and self.attendance_system and self.attendance_system.conn:
-            self.attendance_system.disconnect()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.checkin_var.set("Total Check-ins: 0")
-        self.checkout_var.set("Total Check-outs: 0")
-        self.unique_users_var.set("Unique Users: 0")
+        if self.session:
+            # Close the held session itself; the manager may no longer list it
+            self.session.close()
+            self.session_manager.close(self.attendance_system.ip_address, self.attendance_system.port)
+            self.session = None
+        self.table.clear()
+        self._set_summary(0, 0, set())
         self.status_var.set("Disconnected")
-        self.connect_button.config(state=tk.NORMAL)
-        self.disconnect_button.config(state=tk.DISABLED)
-        self.show_raw_button.config(state=tk.DISABLED)
-        self.export_button.config(state=tk.DISABLED)
-        self.export_pdf_button.config(state=tk.DISABLED)
-    
+        self._update_buttons()
+
+    def _start_job(self, name, work, on_done, on_error=None):
+        """Run work(job) off the Tk thread and call on_done(result) back on it"""
+        def default_error(e):
+            messagebox.showerror("Error", str(e))
+            self.status_var.set(f"Error during {name}")
+
+        def on_cancel():
+            self.status_var.set(f"Cancelled {name}")
+
+        return self.jobs.submit(name, work, on_done=on_done, on_error=on_error or default_error,
+                                on_progress=self.status_var.set, on_cancel=on_cancel)
+
+    def _update_buttons(self, busy=False):
+        """Enable buttons that fit the connection state; disable all but Cancel while a job runs"""
+        # Nothing is usable (or cancellable) until startup setup has finished
+        ready = self.session_manager is not None
+        busy = busy or not ready
+        connected = self.session is not None and not busy
+        self.connect_button.config(state=tk.DISABLED if busy or self.session else tk.NORMAL)
+        self.disconnect_button.config(state=tk.NORMAL if connected else tk.DISABLED)
+        for button in (self.show_raw_button, self.export_button, self.export_pdf_button, self.live_button):
+            button.config(state=tk.NORMAL if connected else tk.DISABLED)
+        self.collect_all_button.config(state=tk.DISABLED if busy else tk.NORMAL)
+        self.cancel_button.config(state=tk.NORMAL if busy and ready else tk.DISABLED)
+
+    def cancel_job(self):
+        self.jobs.cancel()
+        self.status_var.set("Cancelling...")
+
+    def _fetch_paired_records(self, job, start_date, end_date):
+        job.report("Retrieving attendance records...")
+        records = self.session.run(lambda a: a.get_attendance(start_date, end_date))
+        if records is not None and not records.empty:
+            records['device_name'] = getattr(self, 'current_device_name', 'Unknown')
+        return records
+
     def export_records(self):
-        if not self.attendance_system or not self.attendance_system.conn:
+        if not self.session:
             messagebox.showerror("Error", "Please connect to the device first")
             return
-        try:
-            import datetime
-            start_date = self.start_date.get_date()
-            end_date = self.end_date.get_date()
-            records = self.attendance_system.get_attendance(start_date, end_date)
-            if records is not None and not records.empty:
-                device_name = getattr(self, 'current_device_name', 'Unknown')
-                safe_device = str(device_name).replace(' ', '_').replace('/', '_')
-                records['device_name'] = device_name
-                now = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                default_filename = f"attendance_{safe_device}_{now}.csv"
-                filename = filedialog.asksaveasfilename(
-                    defaultextension=".csv",
-                    filetypes=[("CSV files", "*.csv")],
-                    initialfile=default_filename
-                )
-                if filename:
-                    records.to_csv(filename, index=False)
-                    self.status_var.set(f"Records exported to {filename}")
-                    messagebox.showinfo("Success", f"Records exported to {filename}")
-            else:
+        import datetime
+        start_date = self.start_date.get_date()
+        end_date = self.end_date.get_date()
+        device_name = getattr(self, 'current_device_name', 'Unknown')
+        safe_device = str(device_name).replace(' ', '_').replace('/', '_')
+        now = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        default_filename = f"attendance_{safe_device}_{now}.csv"
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx")],
+            initialfile=default_filename
+        )
+        if not filename:
+            return
+
+        if filename.lower().endswith(".xlsx"):
+            try:
+                import openpyxl
+            except ImportError:
+                messagebox.showerror("Missing Dependency", "Please install openpyxl to export XLSX.")
+                return
+
+        from attendance_export import export_stream
+
+        def work(job):
+            # Chunks are written as they are paired, one date window at a time
+            return self.session.run(lambda a: export_stream(
+                filename, a.iter_attendance(start_date, end_date, device_name=device_name),
+                progress=job.report, should_stop=lambda: job.cancelled))
+
+        def on_written(rows):
+            if not rows:
+                if rows == 0 and os.path.exists(filename):
+                    os.remove(filename)
                 self.status_var.set("No records to export")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self.status_var.set("Error exporting records")
+                return
+            self.status_var.set(f"{rows} records exported to {filename}")
+            messagebox.showinfo("Success", f"Records exported to {filename}")
+
+        self._start_job("export", work, on_written)
 
     def export_records_pdf(self):
         try:
@@ -258,111 +391,195 @@ class AttendanceGUI:
         except ImportError:
             messagebox.showerror("Missing Dependency", "Please install fpdf to export PDF.")
             return
-        if not self.attendance_system or not self.attendance_system.conn:
+        if not self.session:
             messagebox.showerror("Error", "Please connect to the device first")
             return
-        try:
-            import datetime
-            start_date = self.start_date.get_date()
-            end_date = self.end_date.get_date()
-            records = self.attendance_system.get_attendance(start_date, end_date)
-            if records is not None and not records.empty:
-                device_name = getattr(self, 'current_device_name', 'Unknown')
-                safe_device = str(device_name).replace(' ', '_').replace('/', '_')
-                records['device_name'] = device_name
-                now = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                default_filename = f"attendance_{safe_device}_{now}.pdf"
-                filename = filedialog.asksaveasfilename(
-                    defaultextension=".pdf",
-                    filetypes=[("PDF files", "*.pdf")],
-                    initialfile=default_filename
-                )
-                if not filename:
-                    return
-                pdf = FPDF()
-                pdf.add_page()
-                pdf.set_font("Arial", size=10)
-                pdf.cell(0, 10, f"Attendance Records: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}", ln=True, align='C')
-                pdf.ln(5)
-                col_widths = [20, 35, 25, 25, 25, 30, 30]
-                headers = ['User ID', 'Name', 'Date', 'Check In', 'Check Out', 'Duration (hours)', 'Device Name']
-                for i, header in enumerate(headers):
-                    pdf.cell(col_widths[i], 8, header, border=1, align='C')
-                pdf.ln()
-                for _, row in records.iterrows():
-                    duration = f"{row['duration']:.2f}" if 'duration' in row and pd.notnull(row['duration']) else "N/A"
-                    pdf.cell(col_widths[0], 8, str(row['user_id']), border=1)
-                    pdf.cell(col_widths[1], 8, str(row['user_name']), border=1)
-                    pdf.cell(col_widths[2], 8, row['date'].strftime('%Y-%m-%d') if 'date' in row and pd.notnull(row['date']) else "N/A", border=1)
-                    pdf.cell(col_widths[3], 8, row['check_in'].strftime('%H:%M:%S') if 'check_in' in row and pd.notnull(row['check_in']) else "N/A", border=1)
-                    pdf.cell(col_widths[4], 8, row['check_out'].strftime('%H:%M:%S') if 'check_out' in row and pd.notnull(row['check_out']) else "N/A", border=1)
-                    pdf.cell(col_widths[5], 8, duration, border=1)
-                    pdf.cell(col_widths[6], 8, row['device_name'], border=1)
-                    pdf.ln()
-                pdf.output(filename)
+        import datetime
+        from attendance_report import PAIRED_REPORT_COLUMNS, format_paired_columns, write_pdf_report
+        start_date = self.start_date.get_date()
+        end_date = self.end_date.get_date()
+
+        def write_pdf(job, records, filename):
+            title = f"Attendance Records: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+            return write_pdf_report(filename, title, PAIRED_REPORT_COLUMNS, records, format_paired_columns,
+                                    progress=job.report, should_stop=lambda: job.cancelled)
+
+        def on_fetched(records):
+            if records is None or records.empty:
+                self.status_var.set("No records to export")
+                return
+            device_name = getattr(self, 'current_device_name', 'Unknown')
+            safe_device = str(device_name).replace(' ', '_').replace('/', '_')
+            now = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            default_filename = f"attendance_{safe_device}_{now}.pdf"
+            filename = filedialog.asksaveasfilename(
+                defaultextension=".pdf",
+                filetypes=[("PDF files", "*.pdf")],
+                initialfile=default_filename
+            )
+            if not filename:
+                return
+
+            def on_written(_):
                 self.status_var.set(f"Records exported to {os.path.basename(filename)}")
                 messagebox.showinfo("Success", f"Records exported to {filename}")
-            else:
-                self.status_var.set("No records to export")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self.status_var.set("Error exporting records to PDF")
+
+            self._start_job("PDF export", lambda job: write_pdf(job, records, filename), on_written)
+
+        self._start_job("PDF export", lambda job: self._fetch_paired_records(job, start_date, end_date), on_fetched)
 
     def show_raw_logs(self):
-        if not self.attendance_system or not self.attendance_system.conn:
+        if not self.session:
             messagebox.showerror("Error", "Please connect to the device first")
             return
-        try:
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            start_date = self.start_date.get_date()
-            end_date = self.end_date.get_date()
-            device_name = getattr(self, 'current_device_name', 'Unknown')
-            records = self.attendance_system.get_raw_attendance(start_date, end_date, device_name=device_name)
-            # Update summary panel
-            if records is not None and not records.empty:
-                total_checkins = (records['status'] == 'Check In').sum()
-                total_checkouts = (records['status'] == 'Check Out').sum()
-                unique_users = records['user_id'].nunique()
-                self.checkin_var.set(f"Total Check-ins: {total_checkins}")
-                self.checkout_var.set(f"Total Check-outs: {total_checkouts}")
-                self.unique_users_var.set(f"Unique Users: {unique_users}")
-                # Define tag styles for row colors
-                self.tree.tag_configure('checkin', background='#d4f7d4')  # light green
-                self.tree.tag_configure('checkout', background='#d4e6f7')  # light blue
-                for _, row in records.iterrows():
-                    if row['status'] == 'Check In':
-                        check_in = row['timestamp'].strftime('%H:%M:%S')
-                        check_out = ''
-                        tag = 'checkin'
-                    elif row['status'] == 'Check Out':
-                        check_in = ''
-                        check_out = row['timestamp'].strftime('%H:%M:%S')
-                        tag = 'checkout'
-                    else:
-                        check_in = ''
-                        check_out = ''
-                        tag = ''
-                    self.tree.insert('', tk.END, values=(
-                        row['user_id'],
-                        row['user_name'],
-                        row['timestamp'].strftime('%Y-%m-%d'),
-                        check_in,
-                        check_out,
-                        row['device_name']
-                    ), tags=(tag,))
-                self.status_var.set(f"Retrieved {len(records)} raw logs")
-                self._last_raw_records = records  # Store for user details popup
-            else:
-                self.checkin_var.set("Total Check-ins: 0")
-                self.checkout_var.set("Total Check-outs: 0")
-                self.unique_users_var.set("Unique Users: 0")
-                self.status_var.set("No raw logs found")
-                self._last_raw_records = None
-        except Exception as e:
+        start_date = self.start_date.get_date()
+        end_date = self.end_date.get_date()
+        device_name = getattr(self, 'current_device_name', 'Unknown')
+
+        def fetch(a):
+            records = a.get_raw_attendance(start_date, end_date, device_name=device_name)
+            # The store's daily summaries give the counters without rescanning the records
+            counts = a.store.summary_counts(a.device_key, start_date, end_date) if a.store else None
+            return records, counts
+
+        def work(job):
+            job.report("Retrieving raw logs...")
+            return self.session.run(fetch)
+
+        def on_error(e):
             messagebox.showerror("Error", str(e))
             self.status_var.set("Error retrieving raw logs")
 
+        self._start_job("raw log fetch", work, lambda result: self._display_raw_records(*result), on_error)
+
+    def collect_all_devices(self):
+        if not self.saved_devices:
+            messagebox.showwarning("No Devices", "No saved devices to collect from.")
+            return
+        start_date = self.start_date.get_date()
+        end_date = self.end_date.get_date()
+        devices = list(self.saved_devices)
+        from attendance_collector import DUPLICATE_WINDOW_SECONDS, MultiDeviceCollector
+
+        def work(job):
+            job.report(f"Collecting from {len(devices)} devices...")
+            # A user punching on two terminals (or twice) within the window counts once
+            collector = MultiDeviceCollector(devices, store=self.attendance_store,
+                                             duplicate_window=DUPLICATE_WINDOW_SECONDS)
+            return collector.collect(start_date, end_date)
+
+        def on_done(result):
+            self._display_raw_records(result.attendance)
+            ok = len(result.report) - len(result.failed)
+            self.status_var.set(f"Collected from {ok}/{len(result.report)} devices")
+            if result.failed:
+                failures = "\n".join(f"{r['name']} ({r['ip']}): {r['error']}" for r in result.failed)
+                messagebox.showwarning("Some Devices Failed", failures)
+
+        def on_error(e):
+            messagebox.showerror("Error", str(e))
+            self.status_var.set("Error collecting from devices")
+
+        self._start_job("collection", work, on_done, on_error)
+
+    def _format_raw_rows(self, records):
+        """Format a slice of raw logs into Treeview values and row tags"""
+        import numpy as np
+        status = records['status'].astype(object).values
+        times = records['timestamp'].dt.strftime('%H:%M:%S').values
+        is_in = status == 'Check In'
+        is_out = status == 'Check Out'
+        rows = zip(
+            records['user_id'].astype(str).values,
+            records['user_name'].astype(str).values,
+            records['timestamp'].dt.strftime('%Y-%m-%d').values,
+            np.where(is_in, times, ''),
+            np.where(is_out, times, ''),
+            records['device_name'].astype(str).values,
+        )
+        tags = np.where(is_in, 'checkin', np.where(is_out, 'checkout', ''))
+        return rows, tags
+
+    def _set_summary(self, checkins, checkouts, users):
+        """Show summary counters; `users` is the set of user ids seen so far"""
+        self._summary = [checkins, checkouts, users]
+        self.checkin_var.set(f"Total Check-ins: {checkins}")
+        self.checkout_var.set(f"Total Check-outs: {checkouts}")
+        self.unique_users_var.set(f"Unique Users: {len(users)}")
+
+    def _display_raw_records(self, records, counts=None):
+        """Show raw logs; counts is (check_ins, check_outs, user_ids) if already known"""
+        from attendance_system import UserIndex
+        # Update summary panel
+        if records is not None and not records.empty:
+            if counts is None:
+                counts = (
+                    int((records['status'] == 'Check In').sum()),
+                    int((records['status'] == 'Check Out').sum()),
+                    set(records['user_id'].unique())
+                )
+            self._set_summary(*counts)
+            # Only the rows in view are materialized in the Treeview
+            with metrics.stage("render") as stage:
+                self.table.set_data(records)
+                stage.records = len(records)
+            self._show_sort_indicators()
+            self.status_var.set(f"Retrieved {len(records)} raw logs")
+            self._last_raw_records = self.table.data  # Store for user details popup
+            self._user_index = UserIndex(self._last_raw_records)
+        else:
+            self.table.clear()
+            self._show_sort_indicators()
+            self._set_summary(0, 0, set())
+            self.status_var.set("No raw logs found")
+            self._last_raw_records = None
+
+    def start_live_mode(self):
+        if not self.session:
+            messagebox.showerror("Error", "Please connect to the device first")
+            return
+        device_name = getattr(self, 'current_device_name', 'Unknown')
+        events = queue.Queue()
+
+        def work(job):
+            job.report("Live capture running - press Cancel to stop")
+            self.session.run(lambda a: a.live_capture(events, device_name=device_name,
+                                                      should_stop=lambda: job.cancelled))
+
+        def on_done(_):
+            self.status_var.set("Live capture ended")
+
+        def on_error(e):
+            messagebox.showerror("Error", str(e))
+            self.status_var.set("Live capture failed")
+
+        job = self._start_job("live capture", work, on_done, on_error)
+        self.root.after(200, self._poll_live_events, job, events)
+
+    def _poll_live_events(self, job, events):
+        batch = []
+        while True:
+            try:
+                batch.append(events.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            import pandas as pd
+            punches = pd.DataFrame(batch)
+            # Counters move by the new punches only; nothing is recomputed
+            checkins, checkouts, users = getattr(self, '_summary', [0, 0, set()])
+            self._set_summary(
+                checkins + int((punches['status'] == 'Check In').sum()),
+                checkouts + int((punches['status'] == 'Check Out').sum()),
+                users | set(punches['user_id'])
+            )
+            self.table.append(punches)
+            self._last_raw_records = self.table.data
+            last = batch[-1]
+            self.status_var.set(f"Live: {last['user_name']} {last['status']} at {last['timestamp'].strftime('%H:%M:%S')}")
+        if self.jobs.current is job:
+            self.root.after(200, self._poll_live_events, job, events)
+
     def refresh_device_dropdown(self):
         # Reload devices and update dropdown
         self.saved_devices = []
@@ -420,17 +637,48 @@ class AttendanceGUI:
                 self.device_name_var.set(d["name"])
                 break
 
-    def sort_by_column(self, col, reverse):
-        # Get all items and sort them
-        l = [(self.tree.set(k, col), k) for k in self.tree.get_children('')]
-        try:
-            l.sort(key=lambda t: float(t[0]) if col == 'duration' else t[0], reverse=reverse)
-        except Exception:
-            l.sort(key=lambda t: t[0], reverse=reverse)
-        for index, (val, k) in enumerate(l):
-            self.tree.move(k, '', index)
-        # Reverse sort next time
-        self.tree.heading(col, command=lambda: self.sort_by_column(col, not reverse))
+    def sort_by_column(self, col, add=False):
+        """Sort the table by col, or with add (Shift+click) by col after the current sort columns.
+
+        Clicking a column that is already sorted reverses it. The backing
+        frame is sorted with typed, stable keys and only the view is redrawn.
+        """
+        if self.table is None or self.table.data is None:
+            return
+        keys = list(self.table.sort_keys)
+        current = dict(keys)
+        if add:
+            ascending = not current[col] if col in current else True
+            keys = [(c, ascending if c == col else a) for c, a in keys] if col in current else keys + [(col, True)]
+        else:
+            ascending = not current[col] if keys and keys[0][0] == col else True
+            keys = [(col, ascending)]
+        with metrics.stage("sort") as stage:
+            self.table.sort(keys)
+            stage.records = len(self.table)
+        self._last_raw_records = self.table.data
+        self._show_sort_indicators()
+
+    def _show_sort_indicators(self):
+        keys = self.table.sort_keys if self.table is not None else []
+        for col, text in self._heading_text.items():
+            self.tree.heading(col, text=text)
+        for position, (col, ascending) in enumerate(keys, 1):
+            arrow = "\u25b2" if ascending else "\u25bc"
+            suffix = f" {arrow}{position}" if len(keys) > 1 else f" {arrow}"
+            self.tree.heading(col, text=self._heading_text[col] + suffix)
+
+    def _user_logs(self, user_id):
+        """Return one user's rows from the loaded logs via the per-user index"""
+        records = getattr(self, '_last_raw_records', None)
+        if records is None or records.empty:
+            return None
+        # Loading, sorting and live appends replace the frame; index each frame once
+        index = getattr(self, '_user_index', None)
+        if index is None or index.frame is not records:
+            from attendance_system import UserIndex
+            index = self._user_index = UserIndex(records)
+        return index.get(user_id)
 
     def on_row_double_click(self, event):
         item = self.tree.identify_row(event.y)
@@ -439,19 +687,19 @@ class AttendanceGUI:
         user_id = self.tree.item(item, 'values')[0]
         user_name = self.tree.item(item, 'values')[1]
         # Get all logs for this user in the current date range
-        records = getattr(self, '_last_raw_records', None)
-        if records is None or records.empty:
-            return
-        user_logs = records[records['user_id'] == user_id]
-        if user_logs.empty:
+        user_logs = self._user_logs(user_id)
+        if user_logs is None or user_logs.empty:
             return
+        import numpy as np
+        from attendance_report import RAW_REPORT_COLUMNS, format_raw_columns, write_pdf_report
         # Create popup window
         popup = tk.Toplevel(self.root)
         popup.title(f"Attendance Details for {user_name} ({user_id})")
         popup.geometry("700x400")
         # Summary
-        total_checkins = (user_logs['status'] == 'Check In').sum()
-        total_checkouts = (user_logs['status'] == 'Check Out').sum()
+        status = user_logs['status'].astype(object).values
+        total_checkins = int((status == 'Check In').sum())
+        total_checkouts = int((status == 'Check Out').sum())
         summary = f"Check-ins: {total_checkins}    Check-outs: {total_checkouts}    Total logs: {len(user_logs)}"
         ttk.Label(popup, text=summary, font=("Arial", 12, "bold")).pack(pady=10)
         # Table
@@ -469,25 +717,12 @@ class AttendanceGUI:
         tree.tag_configure('checkin', background='#d4f7d4')  # light green
         tree.tag_configure('checkout', background='#d4e6f7')  # light blue
         tree.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
-        for _, row in user_logs.iterrows():
-            if row['status'] == 'Check In':
-                check_in = row['timestamp'].strftime('%H:%M:%S')
-                check_out = ''
-                tag = 'checkin'
-            elif row['status'] == 'Check Out':
-                check_in = ''
-                check_out = row['timestamp'].strftime('%H:%M:%S')
-                tag = 'checkout'
-            else:
-                check_in = ''
-                check_out = ''
-                tag = ''
-            tree.insert('', tk.END, values=(
-                row['timestamp'].strftime('%Y-%m-%d'),
-                check_in,
-                check_out,
-                row['device_name']
-            ), tags=(tag,))
+        formatted = format_raw_columns(user_logs)
+        tags = np.where(status == 'Check In', 'checkin', np.where(status == 'Check Out', 'checkout', ''))
+        rows = zip(formatted['date'].values, formatted['check_in'], formatted['check_out'],
+                   formatted['device_name'].values)
+        for values, tag in zip(rows, tags):
+            tree.insert('', tk.END, values=values, tags=(tag,) if tag else ())
         # Export dropdown button
         import datetime
         def get_export_filename(ext):
@@ -501,12 +736,7 @@ class AttendanceGUI:
                 initialfile=get_export_filename('csv')
             )
             if filename:
-                export_df = user_logs.copy()
-                export_df['date'] = export_df['timestamp'].dt.strftime('%Y-%m-%d')
-                export_df['check_in'] = export_df.apply(lambda r: r['timestamp'].strftime('%H:%M:%S') if r['status'] == 'Check In' else '', axis=1)
-                export_df['check_out'] = export_df.apply(lambda r: r['timestamp'].strftime('%H:%M:%S') if r['status'] == 'Check Out' else '', axis=1)
-                export_df = export_df[['user_id', 'user_name', 'date', 'check_in', 'check_out', 'device_name']]
-                export_df.to_csv(filename, index=False)
+                format_raw_columns(user_logs).to_csv(filename, index=False)
                 messagebox.showinfo("Exported", f"User summary exported to {filename}")
         def export_pdf():
             try:
@@ -521,25 +751,8 @@ class AttendanceGUI:
             )
             if not filename:
                 return
-            export_df = user_logs.copy()
-            export_df['date'] = export_df['timestamp'].dt.strftime('%Y-%m-%d')
-            export_df['check_in'] = export_df.apply(lambda r: r['timestamp'].strftime('%H:%M:%S') if r['status'] == 'Check In' else '', axis=1)
-            export_df['check_out'] = export_df.apply(lambda r: r['timestamp'].strftime('%H:%M:%S') if r['status'] == 'Check Out' else '', axis=1)
-            export_df = export_df[['user_id', 'user_name', 'date', 'check_in', 'check_out', 'device_name']]
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=10)
-            pdf.cell(0, 10, f"Attendance Details for {user_name} ({user_id})", ln=True, align='C')
-            pdf.ln(5)
-            col_widths = [30] * len(export_df.columns)
-            for col in export_df.columns:
-                pdf.cell(30, 8, str(col), border=1, align='C')
-            pdf.ln()
-            for _, row in export_df.iterrows():
-                for col in export_df.columns:
-                    pdf.cell(30, 8, str(row[col]), border=1)
-                pdf.ln()
-            pdf.output(filename)
+            write_pdf_report(filename, f"Attendance Details for {user_name} ({user_id})", RAW_REPORT_COLUMNS,
+                             user_logs, format_raw_columns)
             messagebox.showinfo("Exported", f"User summary exported to {filename}")
         btn_frame = ttk.Frame(popup)
         btn_frame.pack(pady=10)
@@ -551,6 +764,14 @@ class AttendanceGUI:
         export_btn = ttk.Button(btn_frame, text="Export", command=show_export_menu)
         export_btn.pack(side=tk.LEFT, padx=10)
 
+    def on_close(self):
+        self.jobs.cancel()
+        if self.session_manager:
+            self.session_manager.close_all()
+        if self.attendance_store:
+            self.attendance_store.close()
+        self.root.destroy()
+
     def _add_menu_bar(self):
         menubar = tk.Menu(self.root)
         self.root.config(menu=menubar)
@@ -579,8 +800,17 @@ class AttendanceGUI:
         self.root.wait_window(about)
 
 def main():
-    root = tk.Tk()
-    app = AttendanceGUI(root)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    configure_from_env()
+    with metrics.stage("startup_window"):
+        root = tk.Tk()
+        app = AttendanceGUI(root)
+        root.update_idletasks()
+    shown = time.perf_counter() - _STARTED
+    if shown > STARTUP_TARGET_SECONDS:
+        log.warning("Window shown in %.2fs, over the %.1fs target", shown, STARTUP_TARGET_SECONDS)
+    else:
+        log.info("Window shown in %.2fs", shown)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import queue
+import threading
+
+
+class Job:
+    """A unit of background work started by JobRunner.submit"""
+
+    def __init__(self, name, work, on_done=None, on_error=None, on_progress=None, on_cancel=None):
+        self.name = name
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+        self._cancelled = threading.Event()
+        self._events = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Request cancellation.
+
+        Work functions should check job.cancelled between steps. A blocking
+        device call cannot be interrupted, but its result is discarded.
+        """
+        self._cancelled.set()
+
+    def report(self, message):
+        """Send a progress message to the Tk thread (safe to call from the worker)"""
+        self._events.put((self, 'progress', message))
+
+
+class JobRunner:
+    """Runs jobs on worker threads and delivers results on the Tk main thread.
+
+    Workers never touch Tk; they post events to a queue that the main loop
+    drains every poll_ms milliseconds via root.after. Only one job runs at a
+    time, which keeps the single device connection from being shared.
+    """
+
+    def __init__(self, root, on_busy_change=None, poll_ms=100):
+        self.root = root
+        self.on_busy_change = on_busy_change
+        self.poll_ms = poll_ms
+        self.current = None
+        self._events = queue.Queue()
+        self._polling = False
+
+    @property
+    def busy(self):
+        return self.current is not None
+
+    def submit(self, name, work, on_done=None, on_error=None, on_progress=None, on_cancel=None):
+        """Run work(job) on a worker thread; callbacks run on the Tk thread"""
+        if self.busy:
+            raise RuntimeError(f"'{self.current.name}' is still running")
+        job = Job(name, work, on_done, on_error, on_progress, on_cancel)
+        job._events = self._events
+        self.current = job
+        if self.on_busy_change:
+            self.on_busy_change(True)
+        threading.Thread(target=self._run, args=(job,), name=f"job-{name}", daemon=True).start()
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return job
+
+    def cancel(self):
+        if self.current:
+            self.current.cancel()
+
+    def _run(self, job):
+        try:
+            result = job.work(job)
+            self._events.put((job, 'done', result))
+        except Exception as e:
+            self._events.put((job, 'error', e))
+
+    def _poll(self):
+        while True:
+            try:
+                job, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                if job.on_progress and not job.cancelled:
+                    job.on_progress(payload)
+                continue
+            # The job finished; free the runner before callbacks so they can chain jobs
+            if job is self.current:
+                self.current = None
+                if self.on_busy_change:
+                    self.on_busy_change(False)
+            if job.cancelled:
+                if job.on_cancel:
+                    job.on_cancel()
+            elif kind == 'done':
+                if job.on_done:
+                    job.on_done(payload)
+            elif job.on_error:
+                job.on_error(payload)
+        if self.current is not None:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,153 @@
+"""Per-stage timing and counters for the attendance pipeline.
+
+Code wraps each stage in ``metrics.stage(name, device)`` and may set
+``records`` and ``bytes`` on the object it yields:
+
+    with metrics.stage("download", self.device_key) as stage:
+        attendance = self.conn.get_attendance()
+        stage.records = len(attendance)
+
+Per (stage, device) the registry keeps call and error counts, total and
+last duration, and total records and bytes. Read them with
+``metrics.snapshot()`` or write them in Prometheus text format with
+``metrics.write_text(path)``. Collection is off by default; while disabled
+``stage()`` hands out one shared no-op object, so the cost is a flag check.
+Set ATTENDANCE_METRICS_FILE to enable collection and write the file at exit.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class _NullStage:
+    """Shared stand-in used while metrics are disabled"""
+    records = None
+    bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('registry', 'name', 'device', 'records', 'bytes', 'started')
+
+    def __init__(self, registry, name, device):
+        self.registry = registry
+        self.name = name
+        self.device = device
+        self.records = None
+        self.bytes = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        self.registry._record(self.name, self.device, seconds, self.records, self.bytes, exc_type is not None)
+        log.debug("%s%s took %.3fs (records=%s, bytes=%s)", self.name,
+                  f" [{self.device}]" if self.device else "", seconds, self.records, self.bytes)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def stage(self, name, device=None):
+        """Context manager timing one run of a stage"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, device)
+
+    def _record(self, name, device, seconds, records, nbytes, failed):
+        with self._lock:
+            stats = self._stats.get((name, device))
+            if stats is None:
+                stats = self._stats[(name, device)] = {
+                    'calls': 0, 'errors': 0, 'seconds': 0.0, 'last_seconds': 0.0, 'records': 0, 'bytes': 0,
+                }
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['seconds'] += seconds
+            stats['last_seconds'] = seconds
+            stats['records'] += records or 0
+            stats['bytes'] += nbytes or 0
+
+    def snapshot(self):
+        """Return one dict per (stage, device) with its accumulated counters"""
+        with self._lock:
+            return [
+                {'stage': name, 'device': device, **stats}
+                for (name, device), stats in sorted(self._stats.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+            ]
+
+    def write_text(self, path):
+        """Write the counters in the Prometheus text exposition format.
+
+        The file is written next to its target and renamed into place, so a
+        node_exporter textfile collector never reads a partial file.
+        """
+        series = [
+            ('attendance_stage_calls_total', 'counter', 'calls', "Number of times the stage ran"),
+            ('attendance_stage_errors_total', 'counter', 'errors', "Runs that raised an exception"),
+            ('attendance_stage_seconds_total', 'counter', 'seconds', "Total time spent in the stage"),
+            ('attendance_stage_last_seconds', 'gauge', 'last_seconds', "Duration of the latest run"),
+            ('attendance_stage_records_total', 'counter', 'records', "Records handled by the stage"),
+            ('attendance_stage_bytes_total', 'counter', 'bytes', "Bytes read or written by the stage"),
+        ]
+        snapshot = self.snapshot()
+        lines = []
+        for metric, kind, key, help_text in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for stats in snapshot:
+                labels = f'stage="{_escape(stats["stage"])}"'
+                if stats['device']:
+                    labels += f',device="{_escape(stats["device"])}"'
+                lines.append(f"{metric}{{{labels}}} {stats[key]}")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+
+
+def configure_from_env():
+    """Enable metrics and write them at exit if ATTENDANCE_METRICS_FILE is set"""
+    path = os.environ.get("ATTENDANCE_METRICS_FILE")
+    if path and not metrics.enabled:
+        metrics.enable()
+        atexit.register(metrics.write_text, path)
+    return path
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import pandas as pd
+from attendance_metrics import metrics
+
+PAIRED_REPORT_COLUMNS = [
+    ('User ID', 20, 'user_id'),
+    ('Name', 35, 'user_name'),
+    ('Date', 25, 'date'),
+    ('Check In', 25, 'check_in'),
+    ('Check Out', 25, 'check_out'),
+    ('Duration (hours)', 30, 'duration'),
+    ('Device Name', 30, 'device_name'),
+]
+
+RAW_REPORT_COLUMNS = [
+    ('user_id', 30, 'user_id'),
+    ('user_name', 30, 'user_name'),
+    ('date', 30, 'date'),
+    ('check_in', 30, 'check_in'),
+    ('check_out', 30, 'check_out'),
+    ('device_name', 30, 'device_name'),
+]
+
+
+def _text(series, missing="N/A"):
+    """Render a column as strings, with missing values shown as `missing`"""
+    return series.astype(object).where(series.notna(), missing).astype(str)
+
+
+def _time_text(series, fmt, missing="N/A"):
+    return pd.to_datetime(series).dt.strftime(fmt).fillna(missing)
+
+
+def format_paired_columns(records):
+    """Format paired attendance (get_attendance output) column by column"""
+    duration = pd.to_numeric(records['duration'], errors='coerce').values
+    duration_text = np.where(np.isnan(duration), "N/A", np.char.mod('%.2f', np.nan_to_num(duration)))
+    return pd.DataFrame({
+        'user_id': _text(records['user_id']),
+        'user_name': _text(records['user_name']),
+        'date': _time_text(records['date'], '%Y-%m-%d'),
+        'check_in': _time_text(records['check_in'], '%H:%M:%S'),
+        'check_out': _time_text(records['check_out'], '%H:%M:%S'),
+        'duration': duration_text,
+        'device_name': _text(records['device_name']) if 'device_name' in records else "N/A",
+    }, index=records.index)
+
+
+def format_raw_columns(records):
+    """Format raw punches (get_raw_attendance output) column by column.
+
+    The punch time goes in check_in or check_out depending on its status.
+    """
+    status = records['status'].astype(object).values
+    times = records['timestamp'].dt.strftime('%H:%M:%S').values
+    return pd.DataFrame({
+        'user_id': _text(records['user_id']),
+        'user_name': _text(records['user_name']),
+        'date': records['timestamp'].dt.strftime('%Y-%m-%d'),
+        'check_in': np.where(status == 'Check In', times, ''),
+        'check_out': np.where(status == 'Check Out', times, ''),
+        'device_name': _text(records['device_name']),
+    }, index=records.index)
+
+
+def raw_sort_column(records, col):
+    """Typed values behind a column of format_raw_columns, for sorting raw punches.
+
+    date sorts by day and check_in/check_out by time of day, missing on rows
+    whose cell is blank; the other columns sort by their own values.
+    """
+    if col == 'date':
+        return pd.Series(records['timestamp'].values.astype('datetime64[D]'))
+    if col in ('check_in', 'check_out'):
+        times = records['timestamp'] - records['timestamp'].dt.normalize()
+        return times.where(records['status'] == ('Check In' if col == 'check_in' else 'Check Out'))
+    return records[col]
+
+
+def _latin1(frame):
+    """The core PDF fonts are Latin-1 only; replace anything else with '?'"""
+    return {
+        col: frame[col].str.encode('latin-1', 'replace').str.decode('latin-1').values
+        for col in frame.columns
+    }
+
+
+def write_pdf_report(filename, title, columns, records, formatter, chunk_size=5000,
+                     row_height=8, progress=None, should_stop=None):
+    """Lay out a tabular PDF report.
+
+    columns is a list of (header, width, key) tuples, and formatter turns a
+    slice of records into a frame of strings keyed by those keys. Records are
+    formatted in chunks of chunk_size rows so only one chunk of strings is
+    alive at a time. The title and column headers are repeated on every
+    page, and each page has a page number. Returns False if should_stop()
+    asked to stop before the file was written.
+    """
+    with metrics.stage("export_pdf") as stage:
+        written = _write_pdf_report(filename, title, columns, records, formatter, chunk_size,
+                                    row_height, progress, should_stop)
+        if written:
+            stage.records = len(records)
+            stage.bytes = os.path.getsize(filename)
+    return written
+
+
+def _write_pdf_report(filename, title, columns, records, formatter, chunk_size,
+                      row_height, progress, should_stop):
+    from fpdf import FPDF
+
+    headers = [header for header, _, _ in columns]
+    widths = [width for _, width, _ in columns]
+    keys = [key for _, _, key in columns]
+
+    class ReportPDF(FPDF):
+        def header(self):
+            self.set_font("Arial", 'B', 10)
+            self.cell(0, 10, title, ln=1, align='C')
+            for header, width in zip(headers, widths):
+                self.cell(width, row_height, header, border=1, align='C')
+            self.ln()
+            self.set_font("Arial", size=10)
+
+        def footer(self):
+            self.set_y(-12)
+            self.set_font("Arial", size=8)
+            self.cell(0, 8, f"Page {self.page_no()}/{{nb}}", align='C')
+
+    pdf = ReportPDF()
+    pdf.alias_nb_pages()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.set_font("Arial", size=10)
+    pdf.add_page()
+
+    total = len(records)
+    for start in range(0, total, chunk_size):
+        if should_stop and should_stop():
+            return False
+        chunk = _latin1(formatter(records.iloc[start:start + chunk_size]))
+        cell = pdf.cell
+        ln = pdf.ln
+        for row in zip(*(chunk[key] for key in keys)):
+            # The first cell of a row triggers the page break, so rows never split
+            for width, text in zip(widths, row):
+                cell(width, row_height, text, border=1)
+            ln()
+        if progress:
+            progress(f"Laid out {min(start + chunk_size, total)} of {total} rows ({pdf.page_no()} pages)")
+    if progress:
+        progress("Writing PDF...")
+    pdf.output(filename)
+    return True
@@ -0,0 +1,211 @@
+import logging
+import random
+import threading
+import time
+from zk.exception import ZKErrorConnection, ZKNetworkError
+from attendance_system import ZKTecoAttendance
+
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+DISCONNECTED = "disconnected"
+FAILED = "failed"
+
+log = logging.getLogger(__name__)
+
+
+class DeviceSession:
+    """A reusable connection to one device.
+
+    The session keeps its ZKTecoAttendance connected between operations,
+    validates the link with a cheap probe before use when it has been quiet
+    for a while, and reconnects with exponential backoff when the link drops.
+    """
+
+    def __init__(self, ip_address, port=4370, timeout=5, password=0, store=None,
+                 probe_interval=30, backoff_base=1.0, backoff_max=60.0, max_retries=5, cache=None):
+        self.attendance_system = ZKTecoAttendance(ip_address, port=port, timeout=timeout, password=password, store=store,
+                                                  cache=cache)
+        self.probe_interval = probe_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self.state = DISCONNECTED
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        self.last_ok = 0.0
+        self.failures = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    @property
+    def key(self):
+        return self.attendance_system.device_key
+
+    @property
+    def is_alive(self):
+        return self.state == CONNECTED and self.attendance_system.conn is not None
+
+    def open(self, retries=None):
+        """Connect if needed; returns True when the session is usable"""
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.is_alive:
+                return True
+            return self._reconnect(retries)
+
+    def close(self):
+        with self.lock:
+            self._drop()
+            self.state = DISCONNECTED
+
+    def _drop(self):
+        try:
+            self.attendance_system.disconnect()
+        except Exception:
+            # The socket is usually already dead when we get here
+            self.attendance_system.conn = None
+
+    def _reconnect(self, retries=None):
+        retries = retries or self.max_retries
+        if self.state == CONNECTED:
+            self.reconnects += 1
+        self.state = RECONNECTING
+        self._drop()
+        delay = self.backoff_base
+        for attempt in range(retries):
+            self.attendance_system.connect()
+            if self.attendance_system.conn:
+                self.state = CONNECTED
+                self.failures = 0
+                self.last_error = None
+                self.last_ok = time.monotonic()
+                return True
+            self.failures += 1
+            self.last_error = self.attendance_system.last_error
+            if attempt < retries - 1:
+                # Full jitter keeps many sessions from retrying in lockstep
+                time.sleep(random.uniform(0, min(delay, self.backoff_max)))
+                delay *= 2
+        self.state = FAILED
+        log.warning("Giving up on %s after %d attempts: %s", self.key, retries, self.last_error)
+        return False
+
+    def probe(self, blocking=True):
+        """Send a cheap command to check the link, reconnecting if it is dead"""
+        if not self.lock.acquire(blocking=blocking):
+            return self.is_alive  # An operation is running, so the link is in use
+        try:
+            if not self.is_alive:
+                return False
+            try:
+                self.attendance_system.conn.get_time()
+                self.last_ok = time.monotonic()
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                log.warning("Keepalive failed for %s: %s", self.key, self.last_error)
+                return self._reconnect()
+        finally:
+            self.lock.release()
+
+    def run(self, operation, *args, **kwargs):
+        """Run operation(attendance_system, *args, **kwargs) on the live connection.
+
+        The link is probed first if it has been quiet for longer than
+        probe_interval, and a network error during the operation triggers
+        one reconnect and retry.
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            if not self.is_alive and not self._reconnect():
+                raise ConnectionError(f"Cannot connect to {self.key}: {self.last_error}")
+            if time.monotonic() - self.last_ok > self.probe_interval and not self.probe():
+                raise ConnectionError(f"Cannot connect to {self.key}: {self.last_error}")
+            try:
+                result = operation(self.attendance_system, *args, **kwargs)
+            except (ZKNetworkError, ZKErrorConnection, OSError) as e:
+                self.last_error = str(e)
+                if not self._reconnect():
+                    raise
+                result = operation(self.attendance_system, *args, **kwargs)
+            self.last_ok = time.monotonic()
+            return result
+
+    def health(self):
+        now = time.monotonic()
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            'idle_seconds': round(now - self.last_used, 1),
+            'last_ok_seconds': round(now - self.last_ok, 1) if self.last_ok else None,
+        }
+
+
+class SessionManager:
+    """Keeps one DeviceSession per device and runs keepalive probes.
+
+    A single background thread probes connected sessions every
+    keepalive_interval seconds and closes sessions that have been idle for
+    longer than idle_timeout. All sessions share the optional ResultCache.
+    """
+
+    def __init__(self, store=None, timeout=5, keepalive_interval=30, idle_timeout=600, cache=None):
+        self.store = store
+        self.cache = cache
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, ip_address, port=4370, password=0):
+        """Return the session for a device, creating it if needed"""
+        key = f"{ip_address}:{port}"
+        with self._lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = DeviceSession(ip_address, port=port, timeout=self.timeout, password=password,
+                                        store=self.store, probe_interval=self.keepalive_interval, cache=self.cache)
+                self.sessions[key] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._keepalive_loop, name="zk-keepalive", daemon=True)
+                self._thread.start()
+        return session
+
+    def close(self, ip_address, port=4370):
+        with self._lock:
+            session = self.sessions.pop(f"{ip_address}:{port}", None)
+        if session:
+            session.close()
+
+    def close_all(self):
+        self._stop.set()
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def health(self):
+        with self._lock:
+            sessions = list(self.sessions.items())
+        return {key: session.health() for key, session in sessions}
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self.keepalive_interval):
+            with self._lock:
+                sessions = list(self.sessions.items())
+            now = time.monotonic()
+            for key, session in sessions:
+                if now - session.last_used > self.idle_timeout:
+                    if session.state != DISCONNECTED:
+                        # Stays registered, so get() and close() still find the
+                        # session that run() may reconnect later
+                        log.info("Closing idle session %s", key)
+                        session.close()
+                elif session.is_alive and now - session.last_ok >= self.keepalive_interval:
+                    session.probe(blocking=False)
@@ -0,0 +1,203 @@
+"""Shift-aware pairing of raw punches into in/out intervals.
+
+Unlike pair_attendance, which keeps one check-in and one check-out per
+calendar day, build_intervals keeps every interval: a check-in paired with
+the user's next punch if that punch is a check-out within max_shift_hours.
+Intervals that cross midnight stay whole. Each interval is attributed to a
+business date, which is the date its shift started. Everything runs as
+whole-array operations after one sort by (user, time).
+"""
+import json
+import os
+from datetime import time as dtime
+import numpy as np
+import pandas as pd
+
+INTERVAL_COLUMNS = ['user_id', 'user_name', 'date', 'shift', 'check_in', 'check_out', 'duration', 'status']
+
+COMPLETE = "complete"
+MISSING_CHECKOUT = "missing_checkout"
+MISSING_CHECKIN = "missing_checkin"
+
+DAY_SECONDS = 24 * 3600
+
+
+def _seconds(value):
+    """'HH:MM[:SS]' or datetime.time -> seconds after midnight"""
+    if isinstance(value, str):
+        value = dtime.fromisoformat(value)
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class Shift:
+    """A named daily shift window; end <= start means it ends the next day.
+
+    A check-in belongs to the shift if it falls between ``grace_minutes``
+    before start and end. The interval's business date is the date on
+    which that occurrence of the shift starts.
+    """
+
+    def __init__(self, name, start, end, grace_minutes=60):
+        self.name = name
+        self.start = _seconds(start)
+        self.end = _seconds(end)
+        self.grace = int(grace_minutes * 60)
+
+    @property
+    def length(self):
+        return (self.end - self.start) % DAY_SECONDS or DAY_SECONDS
+
+    def __repr__(self):
+        return f"Shift({self.name!r}, start={self.start}s, end={self.end}s, grace={self.grace}s)"
+
+
+def load_shifts(path="shifts.json"):
+    """Load shift windows from JSON, returning [] if the file is missing or unreadable.
+
+    The file holds a list like [{"name": "Night", "start": "22:00", "end": "06:00",
+    "grace_minutes": 60}, ...]; earlier shifts win when windows overlap.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        try:
+            return [Shift(**entry) for entry in json.load(f)]
+        except Exception:
+            return []
+
+
+def _business_dates(check_in, shifts):
+    """Return (business date, shift name) arrays for check-in datetime64[ns] values"""
+    day = check_in.astype('datetime64[D]')
+    tod = (check_in - day).astype('timedelta64[s]').astype(np.int64)
+    dates = day.copy()
+    names = np.full(len(check_in), None, dtype=object)
+    unassigned = np.ones(len(check_in), dtype=bool)
+    for shift in shifts:
+        # Seconds since this shift's window opened (grace before its start)
+        since_open = (tod - (shift.start - shift.grace)) % DAY_SECONDS
+        match = unassigned & (since_open < shift.length + shift.grace)
+        # The occurrence starts grace seconds after the window opened
+        starts = check_in[match] - since_open[match].astype('timedelta64[s]') + np.timedelta64(shift.grace, 's')
+        dates[match] = starts.astype('datetime64[D]')
+        names[match] = shift.name
+        unassigned &= ~match
+    return dates, names
+
+
+def build_intervals(df, shifts=None, max_shift_hours=16, duplicate_minutes=5):
+    """Build every check-in/check-out interval from raw punches.
+
+    df needs user_id, timestamp and punch columns (0 = in, 1 = out) and may
+    carry user_name and device_name. Repeated punches of the same kind
+    within duplicate_minutes are treated as one: the first check-in and the
+    last check-out are kept. A check-in pairs with the user's next punch if
+    that is a check-out at most max_shift_hours later. Otherwise it becomes
+    a missing_checkout interval. A check-out that closes nothing becomes a
+    missing_checkin interval. Returns INTERVAL_COLUMNS (plus device_name,
+    the check-in's device), sorted by user and time. Duration is in hours
+    and is NaN for incomplete intervals.
+    """
+    columns = INTERVAL_COLUMNS + (['device_name'] if df is not None and 'device_name' in df else [])
+    if df is None or df.empty:
+        return pd.DataFrame(columns=columns)
+
+    user_ids = df['user_id']
+    if isinstance(user_ids.dtype, pd.CategoricalDtype):
+        codes = user_ids.cat.codes.values.astype(np.int64)
+    else:
+        codes = pd.factorize(user_ids)[0].astype(np.int64)
+    ts = pd.to_datetime(df['timestamp']).values.astype('datetime64[ns]')
+    punch = df['punch'].values
+    # Only in and out punches take part; break/overtime codes are ignored
+    keep = np.flatnonzero((punch == 0) | (punch == 1))
+    order = _user_time_order(codes[keep], ts[keep])
+    order = keep[order]
+    codes, ts, punch = codes[order], ts[order], punch[order]
+
+    # Collapse bursts: drop a check-in repeated soon after one, and a
+    # check-out followed soon by another
+    window = np.timedelta64(int(duplicate_minutes * 60), 's')
+    same_as_prev = np.zeros(len(order), dtype=bool)
+    same_as_prev[1:] = (codes[1:] == codes[:-1]) & (punch[1:] == punch[:-1]) & (ts[1:] - ts[:-1] <= window)
+    same_as_next = np.zeros(len(order), dtype=bool)
+    same_as_next[:-1] = same_as_prev[1:]
+    drop = ((punch == 0) & same_as_prev) | ((punch == 1) & same_as_next)
+    order, codes, ts, punch = order[~drop], codes[~drop], ts[~drop], punch[~drop]
+
+    # A check-in closes on the next row when that row is the same user's check-out in time
+    limit = np.timedelta64(int(max_shift_hours * 3600), 's')
+    closes = np.zeros(len(order), dtype=bool)
+    closes[:-1] = (
+        (punch[:-1] == 0) & (punch[1:] == 1) & (codes[:-1] == codes[1:]) & (ts[1:] - ts[:-1] <= limit)
+    )
+    closed = np.zeros(len(order), dtype=bool)
+    closed[1:] = closes[:-1]
+    opens = punch == 0
+    orphans = (punch == 1) & ~closed
+
+    in_rows = np.flatnonzero(opens)
+    out_rows = np.flatnonzero(orphans)
+    check_in = np.concatenate([ts[in_rows], np.full(len(out_rows), np.datetime64('NaT'), dtype='datetime64[ns]')])
+    next_ts = np.empty_like(ts)
+    next_ts[:-1] = ts[1:]
+    check_out = np.concatenate([
+        np.where(closes[in_rows], next_ts[in_rows], np.datetime64('NaT')), ts[out_rows]
+    ]).astype('datetime64[ns]')
+    source = np.concatenate([order[in_rows], order[out_rows]])
+    status = pd.Categorical.from_codes(
+        np.concatenate([np.where(closes[in_rows], 0, 1), np.full(len(out_rows), 2)]).astype(np.int8),
+        categories=[COMPLETE, MISSING_CHECKOUT, MISSING_CHECKIN],
+    )
+
+    # Business dates come from the check-in; a lone check-out keeps its own date
+    dates, names = _business_dates(check_in[:len(in_rows)], shifts or [])
+    dates = np.concatenate([dates, ts[out_rows].astype('datetime64[D]')])
+    names = np.concatenate([names, np.full(len(out_rows), None, dtype=object)])
+
+    src = df.iloc[source]
+    result = pd.DataFrame({
+        'user_id': src['user_id'].astype(object).values,
+        'user_name': src['user_name'].astype(object).values if 'user_name' in df else None,
+        'date': pd.to_datetime(dates).date,
+        'shift': names,
+        'check_in': check_in,
+        'check_out': check_out,
+        'duration': (pd.Series(check_out) - pd.Series(check_in)).dt.total_seconds().values / 3600,
+        'status': status,
+    })
+    if 'device_name' in df:
+        result['device_name'] = src['device_name'].astype(object).values
+    sort_key = np.where(np.isnat(check_in), check_out, check_in)
+    order = _user_time_order(np.concatenate([codes[in_rows], codes[out_rows]]), sort_key)
+    return result.iloc[order].reset_index(drop=True)[columns]
+
+
+def _user_time_order(codes, ts):
+    """Stable (user, time) ordering as two stable argsorts.
+
+    Logs usually arrive in time order, which the first (timsort) pass finds
+    in near-linear time; user codes narrowed to 16 bits are radix-sorted.
+    """
+    by_time = np.argsort(ts, kind='stable')
+    if len(codes) and codes.max() < np.iinfo(np.int16).max:
+        codes = codes.astype(np.int16)
+    return by_time[np.argsort(codes[by_time], kind='stable')]
+
+
+def interval_hours(intervals):
+    """Total complete hours and interval counts per user per business date"""
+    if intervals is None or intervals.empty:
+        return pd.DataFrame(columns=['user_id', 'user_name', 'date', 'hours', 'intervals', 'incomplete'])
+    complete = intervals['status'] == COMPLETE
+    frame = intervals.assign(
+        complete=complete,
+        incomplete=~complete,
+        hours=intervals['duration'].fillna(0),
+    )
+    return frame.groupby(['user_id', 'date'], sort=True).agg(
+        user_name=('user_name', 'first'),
+        hours=('hours', 'sum'),
+        intervals=('complete', 'sum'),
+        incomplete=('incomplete', 'sum'),
+    ).reset_index()[['user_id', 'user_name', 'date', 'hours', 'intervals', 'incomplete']]
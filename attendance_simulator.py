@@ -0,0 +1,317 @@
+"""Local stand-in for a ZKTeco terminal.
+
+Speaks enough of the TCP protocol on port 4370 for pyzk (and therefore
+ZKTecoAttendance) to connect, read the memory counters, download users and
+attendance, read the clock, clear the log and receive live punch events.
+Requests with a bad checksum are answered with CMD_ACK_ERROR. Users and punches are synthetic, and latency, dropped replies and dropped
+connections can be injected.
+
+    python attendance_simulator.py --port 4370 --users 2000 --punches 1000000
+
+Connect with ZKTecoAttendance("127.0.0.1", port=4370, ommit_ping=True).
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+from datetime import datetime
+from struct import pack, unpack
+import numpy as np
+from zk import const
+from zk.base import make_commkey
+
+MACHINE_PREPARE_DATA = (const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2)
+CMD_READ_BUFFER = 1503  # pyzk's read_with_buffer ("prepare buffer")
+CMD_READ_CHUNK = 1504  # pyzk's __read_chunk
+
+USER_DTYPE = np.dtype([
+    ('uid', '<u2'), ('privilege', 'u1'), ('password', 'S8'), ('name', 'S24'),
+    ('card', '<u4'), ('pad1', 'u1'), ('group_id', 'S7'), ('pad2', 'u1'), ('user_id', 'S24'),
+])  # 72-byte ZK8 user record
+ATTENDANCE_DTYPE = np.dtype([
+    ('uid', '<u2'), ('user_id', 'S24'), ('status', 'u1'), ('timestamp', '<u4'),
+    ('punch', 'u1'), ('space', 'S8'),
+])  # 40-byte attendance record
+
+
+def encode_time(t):
+    """Encode a datetime the way the terminal stores it (zkemsdk.c EncodeTime)"""
+    return (
+        ((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) * (24 * 60 * 60)
+        + (t.hour * 60 + t.minute) * 60 + t.second
+    )
+
+
+def encode_times(timestamps):
+    """Vectorised encode_time for a datetime64 array"""
+    ts = np.asarray(timestamps, dtype='datetime64[s]')
+    years = ts.astype('datetime64[Y]').astype(int) + 1970
+    months = ts.astype('datetime64[M]').astype(int) % 12 + 1
+    days = (ts.astype('datetime64[D]') - ts.astype('datetime64[M]')).astype(int) + 1
+    seconds = (ts - ts.astype('datetime64[D]')).astype(int)
+    return (((years % 100) * 12 * 31 + (months - 1) * 31 + days - 1) * 86400 + seconds).astype('<u4')
+
+
+def checksum(payload):
+    """Packet checksum as computed by the terminal firmware"""
+    if len(payload) % 2:
+        payload += b'\x00'
+    total = sum(unpack(f'<{len(payload) // 2}H', payload))
+    while total > const.USHRT_MAX:
+        total -= const.USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += const.USHRT_MAX
+    return total
+
+
+def request_checksum_ok(body):
+    """Check a client request's checksum as pyzk builds it (see pyzk's __create_header).
+
+    The checksum covers the header with the previous reply id, one less
+    than the id the packet carries.
+    """
+    command, received, session_id, reply_id = unpack('<4H', body[:8])
+    previous = (reply_id - 1) % const.USHRT_MAX
+    return checksum(pack('<4H', command, 0, session_id, previous) + body[8:]) == received
+
+
+class SimulatedDevice:
+    """Synthetic terminal state shared by all connections to one port"""
+
+    def __init__(self, users=100, punches=10000, days=30, password=0, seed=0,
+                 latency=0.0, loss=0.0, disconnect=0.0, live_interval=2.0):
+        self.password = password
+        self.latency = latency  # Seconds added before every reply
+        self.loss = loss  # Probability of silently dropping a reply
+        self.disconnect = disconnect  # Probability of closing the socket instead of replying
+        self.live_interval = live_interval  # Seconds between live punch events
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.users = self._make_users(users)
+        self.attendance = self._make_attendance(punches, days)
+
+    def _make_users(self, count):
+        users = np.zeros(count, dtype=USER_DTYPE)
+        uids = np.arange(1, count + 1)
+        users['uid'] = uids
+        users['name'] = [f"User {uid}".encode() for uid in uids]
+        users['user_id'] = [str(uid).encode() for uid in uids]
+        return users
+
+    def _make_attendance(self, count, days):
+        records = np.zeros(count, dtype=ATTENDANCE_DTYPE)
+        if count == 0 or len(self.users) == 0:
+            return records
+        end = np.datetime64(datetime.now().replace(microsecond=0), 's')
+        offsets = np.sort(self.rng.integers(0, days * 86400, size=count))
+        picks = self.rng.integers(0, len(self.users), size=count)
+        records['uid'] = self.users['uid'][picks]
+        records['user_id'] = self.users['user_id'][picks]
+        records['status'] = 1
+        records['timestamp'] = encode_times(end - np.timedelta64(days * 86400, 's') + offsets.astype('timedelta64[s]'))
+        records['punch'] = self.rng.integers(0, 2, size=count)
+        return records
+
+    def free_sizes(self):
+        with self.lock:
+            fields = [0] * 20
+            fields[4] = len(self.users)
+            fields[8] = len(self.attendance)
+            fields[14] = 3000  # fingers_cap
+            fields[15] = 10000  # users_cap
+            fields[16] = 1000000  # rec_cap
+            fields[18] = fields[15] - fields[4]  # users_av
+            fields[19] = max(0, fields[16] - fields[8])  # rec_av
+        return pack('20i', *fields) + pack('3i', 0, 0, 0)
+
+    def buffer_for(self, command):
+        with self.lock:
+            data = self.users.tobytes() if command == const.CMD_USERTEMP_RRQ else self.attendance.tobytes()
+        return pack('<I', len(data)) + data
+
+    def clear_attendance(self):
+        with self.lock:
+            self.attendance = self.attendance[:0]
+
+    def live_punch(self):
+        """Append one punch stamped now and return its event payload"""
+        with self.lock:
+            user = self.users[self.rng.integers(0, len(self.users))]
+            now = datetime.now().replace(microsecond=0)
+            record = np.zeros(1, dtype=ATTENDANCE_DTYPE)
+            record['uid'] = user['uid']
+            record['user_id'] = user['user_id']
+            record['status'] = 1
+            record['timestamp'] = encode_time(now)
+            record['punch'] = self.rng.integers(0, 2)
+            self.attendance = np.concatenate([self.attendance, record])
+        timehex = pack('6B', now.year - 2000, now.month, now.day, now.hour, now.minute, now.second)
+        return pack('<24sBB6s', user['user_id'], 1, int(record['punch'][0]), timehex)
+
+
+class DeviceHandler(socketserver.BaseRequestHandler):
+    """One client connection; requests are handled strictly in order"""
+
+    def setup(self):
+        self.device = self.server.device
+        self.session_id = random.randint(1, 0xFFFE)
+        self.authenticated = not self.device.password
+        self.pending = b''
+        self.send_lock = threading.Lock()
+        self.live_stop = None
+
+    def recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def packet(self, command, payload=b'', reply_id=0):
+        header = pack('<4H', command, 0, self.session_id, reply_id)
+        header = pack('<4H', command, checksum(header + payload), self.session_id, reply_id)
+        body = header + payload
+        return pack('<HHI', *MACHINE_PREPARE_DATA, len(body)) + body
+
+    def send(self, data):
+        with self.send_lock:
+            self.request.sendall(data)
+
+    def handle(self):
+        try:
+            while True:
+                top = self.recv_exact(8)
+                magic1, magic2, length = unpack('<HHI', top)
+                if (magic1, magic2) != MACHINE_PREPARE_DATA:
+                    return
+                body = self.recv_exact(length)
+                command, _, _, reply_id = unpack('<4H', body[:8])
+                if not request_checksum_ok(body):
+                    # Refuse it like a terminal would, instead of acting on a corrupt packet
+                    if command != const.CMD_ACK_OK:
+                        self.send(self.packet(const.CMD_ACK_ERROR, b'', reply_id))
+                    continue
+                if command == const.CMD_ACK_OK:
+                    continue  # Client acknowledging a live event
+                reply = self.dispatch(command, body[8:], reply_id)
+                if self.device.latency:
+                    time.sleep(self.device.latency)
+                if self.device.disconnect and random.random() < self.device.disconnect:
+                    return
+                if self.device.loss and random.random() < self.device.loss:
+                    continue
+                if reply:
+                    self.send(reply)
+                if command == const.CMD_EXIT:
+                    return
+        except (ConnectionError, OSError):
+            return
+        finally:
+            if self.live_stop:
+                self.live_stop.set()
+
+    def dispatch(self, command, data, reply_id):
+        ack = lambda payload=b'': self.packet(const.CMD_ACK_OK, payload, reply_id)
+        if command == const.CMD_CONNECT:
+            return self.packet(const.CMD_ACK_OK if self.authenticated else const.CMD_ACK_UNAUTH, b'', reply_id)
+        if command == const.CMD_AUTH:
+            self.authenticated = data == make_commkey(self.device.password, self.session_id)
+            return self.packet(const.CMD_ACK_OK if self.authenticated else const.CMD_ACK_UNAUTH, b'', reply_id)
+        if not self.authenticated:
+            return self.packet(const.CMD_ACK_UNAUTH, b'', reply_id)
+        if command == const.CMD_GET_FREE_SIZES:
+            return ack(self.device.free_sizes())
+        if command == CMD_READ_BUFFER:
+            _, buffer_command, _, _ = unpack('<bhii', data[:11])
+            self.pending = self.device.buffer_for(buffer_command)
+            return ack(b'\x00' + pack('<I', len(self.pending)))
+        if command == CMD_READ_CHUNK:
+            start, size = unpack('<ii', data[:8])
+            chunk = self.pending[start:start + size]
+            return (
+                self.packet(const.CMD_PREPARE_DATA, pack('<II', len(chunk), 0), reply_id)
+                + self.packet(const.CMD_DATA, chunk, reply_id)
+                + ack()
+            )
+        if command == const.CMD_FREE_DATA:
+            self.pending = b''
+            return ack()
+        if command == const.CMD_GET_TIME:
+            return ack(pack('<I', encode_time(datetime.now())))
+        if command == const.CMD_CLEAR_ATTLOG:
+            self.device.clear_attendance()
+            return ack()
+        if command == const.CMD_REG_EVENT:
+            flags = unpack('<I', data[:4])[0] if len(data) >= 4 else 0
+            if self.live_stop:
+                self.live_stop.set()
+                self.live_stop = None
+            if flags:
+                self.live_stop = threading.Event()
+                threading.Thread(target=self.push_events, args=(self.live_stop,), daemon=True).start()
+            return ack()
+        # Enable/disable device, verify, cancel capture, exit, ...
+        return ack()
+
+    def push_events(self, stop):
+        while not stop.wait(self.device.live_interval):
+            try:
+                self.send(self.packet(const.CMD_REG_EVENT, self.device.live_punch(), 0))
+            except OSError:
+                return
+
+
+class DeviceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, device):
+        self.device = device
+        super().__init__(address, DeviceHandler)
+
+
+def start_simulator(host="127.0.0.1", port=4370, **device_options):
+    """Start a simulated device on a background thread and return its server"""
+    server = DeviceServer((host, port), SimulatedDevice(**device_options))
+    threading.Thread(target=server.serve_forever, name=f"zk-sim-{port}", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ZKTeco terminal for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4370)
+    parser.add_argument("--devices", type=int, default=1, help="number of devices on consecutive ports")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--punches", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--password", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added before each reply")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping a reply")
+    parser.add_argument("--disconnect", type=float, default=0.0, help="probability of dropping the connection")
+    parser.add_argument("--live-interval", type=float, default=2.0, help="seconds between live punches")
+    args = parser.parse_args()
+
+    servers = []
+    for index in range(args.devices):
+        servers.append(start_simulator(
+            args.host, args.port + index, users=args.users, punches=args.punches, days=args.days,
+            password=args.password, seed=index, latency=args.latency, loss=args.loss,
+            disconnect=args.disconnect, live_interval=args.live_interval
+        ))
+        print(f"Simulated device listening on {args.host}:{args.port + index} "
+              f"({args.users} users, {args.punches} punches)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
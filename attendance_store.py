@@ -0,0 +1,379 @@
+import sqlite3
+import threading
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    device TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    raw_status INTEGER,
+    punch INTEGER,
+    PRIMARY KEY (device, user_id, timestamp, punch)
+);
+CREATE INDEX IF NOT EXISTS idx_punches_device_timestamp ON punches (device, timestamp);
+CREATE TABLE IF NOT EXISTS users (
+    device TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    name TEXT,
+    uid INTEGER,
+    PRIMARY KEY (device, user_id)
+);
+CREATE TABLE IF NOT EXISTS user_state (
+    device TEXT PRIMARY KEY,
+    signature TEXT,
+    fetched_at TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    device TEXT PRIMARY KEY,
+    last_timestamp TEXT,
+    record_count INTEGER,
+    synced_at TEXT
+);
+CREATE TABLE IF NOT EXISTS daily_summary (
+    device TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    first_in TEXT,
+    last_in TEXT,
+    last_out TEXT,
+    check_ins INTEGER,
+    check_outs INTEGER,
+    punches INTEGER,
+    hours REAL,
+    missing_checkout INTEGER,
+    PRIMARY KEY (device, user_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_daily_summary_device_day ON daily_summary (device, day);
+CREATE TABLE IF NOT EXISTS monthly_summary (
+    device TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    days_present INTEGER,
+    hours REAL,
+    check_ins INTEGER,
+    check_outs INTEGER,
+    punches INTEGER,
+    missing_checkouts INTEGER,
+    PRIMARY KEY (device, user_id, month)
+);
+CREATE INDEX IF NOT EXISTS idx_monthly_summary_device_month ON monthly_summary (device, month);
+"""
+
+# Recompute the daily rows listed in temp.affected_days from the punches.
+# CROSS JOIN keeps the affected keys as the outer loop, so a small ingest
+# reads only its own days through the punches primary key.
+# Hours run from the first check-in to the last check-out of the day; a day
+# with a check-in after its last check-out is flagged as missing a checkout.
+REFRESH_DAILY = """
+INSERT OR REPLACE INTO daily_summary (device, user_id, day, first_in, last_in, last_out,
+                                      check_ins, check_outs, punches, hours, missing_checkout)
+SELECT device, user_id, day, first_in, last_in, last_out, check_ins, check_outs, punches,
+       CASE WHEN last_out > first_in THEN (julianday(last_out) - julianday(first_in)) * 24 ELSE 0 END,
+       check_ins > 0 AND (last_out IS NULL OR last_out < last_in)
+FROM (
+    SELECT p.device, p.user_id, a.day,
+           MIN(CASE WHEN p.punch = 0 THEN p.timestamp END) AS first_in,
+           MAX(CASE WHEN p.punch = 0 THEN p.timestamp END) AS last_in,
+           MAX(CASE WHEN p.punch = 1 THEN p.timestamp END) AS last_out,
+           SUM(p.punch = 0) AS check_ins,
+           SUM(p.punch = 1) AS check_outs,
+           COUNT(*) AS punches
+    FROM temp.affected_days a
+    CROSS JOIN punches p ON p.device = a.device AND p.user_id = a.user_id
+                  AND p.timestamp BETWEEN a.day || ' 00:00:00' AND a.day || ' 23:59:59'
+    GROUP BY p.device, p.user_id, a.day
+)
+"""
+
+# Roll the affected months up from their daily rows
+REFRESH_MONTHLY = """
+INSERT OR REPLACE INTO monthly_summary (device, user_id, month, days_present, hours,
+                                        check_ins, check_outs, punches, missing_checkouts)
+SELECT d.device, d.user_id, m.month, COUNT(*), SUM(d.hours), SUM(d.check_ins), SUM(d.check_outs),
+       SUM(d.punches), SUM(d.missing_checkout)
+FROM (SELECT DISTINCT device, user_id, substr(day, 1, 7) AS month FROM temp.affected_days) m
+CROSS JOIN daily_summary d ON d.device = m.device AND d.user_id = m.user_id
+                    AND d.day BETWEEN m.month || '-01' AND m.month || '-31'
+GROUP BY d.device, d.user_id, m.month
+"""
+
+
+class AttendanceStore:
+    """Local SQLite store of attendance punches, keyed by device.
+
+    Each device keeps a high-water mark (the newest stored punch timestamp)
+    so a sync only ingests punches newer than what is already stored, and
+    date-range queries are answered from the (device, timestamp) index.
+    It also keeps a snapshot of each device's user directory, and per-user
+    daily and monthly summaries that are refreshed for the days touched by
+    each ingest, so reports and counters never rescan the punches.
+    """
+
+    def __init__(self, path="attendance.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS affected_days "
+            "(device TEXT, user_id TEXT, day TEXT, PRIMARY KEY (device, user_id, day))"
+        )
+        # Databases created before device uids were kept get the column added
+        if 'uid' not in {row[1] for row in self.db.execute("PRAGMA table_info(users)")}:
+            self.db.execute("ALTER TABLE users ADD COLUMN uid INTEGER")
+        self.db.commit()
+        # Databases created before the summaries existed get them built once
+        if (self.db.execute("SELECT 1 FROM punches LIMIT 1").fetchone()
+                and not self.db.execute("SELECT 1 FROM daily_summary LIMIT 1").fetchone()):
+            self.rebuild_summaries()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def high_water_mark(self, device):
+        """Return the newest stored punch timestamp for a device, or None"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT last_timestamp FROM sync_state WHERE device = ?", (device,)
+            ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return datetime.strptime(row[0], TIMESTAMP_FORMAT)
+
+    def record_count(self, device):
+        """Return the device record count seen at the last sync, or None"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT record_count FROM sync_state WHERE device = ?", (device,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_record_count(self, device, record_count):
+        """Record the device's record counter, e.g. after its log was cleared"""
+        with self._lock:
+            self.db.execute("UPDATE sync_state SET record_count = ? WHERE device = ?", (record_count, device))
+            self.db.commit()
+
+    def ingest(self, device, attendance, record_count=None, chunk_rows=50000, advance=True):
+        """Store punches newer than the device's high-water mark.
+
+        attendance is a punch frame (user_id, timestamp, raw_status, punch) or
+        a list of pyzk Attendance records. Punches in the same second as the
+        high-water mark are offered again and deduplicated by the primary key.
+        Rows are formatted and inserted chunk_rows at a time. Returns the
+        number of new rows.
+
+        With advance=False (live punches) every punch is stored but the
+        high-water mark and record count are left alone, so the next sync
+        still downloads whatever was punched since the last one.
+        """
+        if not isinstance(attendance, pd.DataFrame):
+            attendance = pd.DataFrame({
+                'user_id': [str(att.user_id) for att in attendance],
+                'timestamp': pd.to_datetime([att.timestamp for att in attendance]),
+                'raw_status': [att.status for att in attendance],
+                'punch': [att.punch for att in attendance],
+            })
+        hwm = self.high_water_mark(device) if advance else None
+        if hwm is not None:
+            attendance = attendance[attendance['timestamp'].values >= np.datetime64(hwm)]
+        with self._lock:
+            before = self.db.total_changes
+            days = set()
+            for start in range(0, len(attendance), chunk_rows):
+                chunk = attendance.iloc[start:start + chunk_rows]
+                user_ids = chunk['user_id'].astype(str).values
+                stamps = np.char.replace(
+                    np.datetime_as_string(chunk['timestamp'].values.astype('datetime64[s]')), 'T', ' '
+                )
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO punches (device, user_id, timestamp, raw_status, punch) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    zip(repeat(device), user_ids.tolist(), stamps.tolist(),
+                        chunk['raw_status'].tolist(), chunk['punch'].tolist())
+                )
+                keys = pd.DataFrame({'user_id': user_ids, 'day': stamps.astype('U10')}).drop_duplicates()
+                days.update(zip(repeat(device), keys['user_id'], keys['day']))
+            inserted = self.db.total_changes - before
+            if inserted:
+                self._refresh_summaries(days)
+            if not advance:
+                self.db.commit()
+                return inserted
+            last = self.db.execute(
+                "SELECT MAX(timestamp) FROM punches WHERE device = ?", (device,)
+            ).fetchone()[0]
+            self.db.execute(
+                "INSERT OR REPLACE INTO sync_state (device, last_timestamp, record_count, synced_at) "
+                "VALUES (?, ?, ?, ?)",
+                (device, last, record_count, datetime.now().strftime(TIMESTAMP_FORMAT))
+            )
+            self.db.commit()
+        return inserted
+
+    def _refresh_summaries(self, days):
+        """Recompute the daily and monthly summaries for (device, user_id, day) keys.
+
+        Called with the lock held; the caller commits.
+        """
+        self.db.execute("DELETE FROM temp.affected_days")
+        self.db.executemany("INSERT OR IGNORE INTO temp.affected_days VALUES (?, ?, ?)", days)
+        self.db.execute(REFRESH_DAILY)
+        self.db.execute(REFRESH_MONTHLY)
+        self.db.execute("DELETE FROM temp.affected_days")
+
+    def rebuild_summaries(self, device=None):
+        """Recompute all summaries (for one device, or all) from the stored punches"""
+        sql = "SELECT DISTINCT device, user_id, substr(timestamp, 1, 10) FROM punches"
+        params = ()
+        if device is not None:
+            sql += " WHERE device = ?"
+            params = (device,)
+        with self._lock:
+            days = self.db.execute(sql, params).fetchall()
+            self._refresh_summaries(days)
+            self.db.commit()
+
+    def daily_summary(self, device=None, start_date=None, end_date=None, user_id=None):
+        """Return per-user daily summaries as a DataFrame sorted by day and user.
+
+        Columns: device, user_id, day, first_in, last_in, last_out, check_ins,
+        check_outs, punches, hours, missing_checkout. device=None covers all
+        devices; the date bounds are inclusive days.
+        """
+        sql = "SELECT * FROM daily_summary WHERE 1"
+        params = []
+        if device is not None:
+            sql += " AND device = ?"
+            params.append(device)
+        if start_date is not None:
+            sql += " AND day >= ?"
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date is not None:
+            sql += " AND day <= ?"
+            params.append(end_date.strftime("%Y-%m-%d"))
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(str(user_id))
+        sql += " ORDER BY day, user_id"
+        with self._lock:
+            df = pd.read_sql_query(sql, self.db, params=params)
+        df['day'] = pd.to_datetime(df['day'], format="%Y-%m-%d").dt.date
+        for col in ('first_in', 'last_in', 'last_out'):
+            df[col] = pd.to_datetime(df[col], format=TIMESTAMP_FORMAT)
+        df['missing_checkout'] = df['missing_checkout'].astype(bool)
+        return df
+
+    def monthly_summary(self, device=None, start_month=None, end_month=None, user_id=None):
+        """Return per-user monthly summaries (payroll view) sorted by month and user.
+
+        Columns: device, user_id, month ('YYYY-MM'), days_present, hours,
+        check_ins, check_outs, punches, missing_checkouts. Month bounds may
+        be 'YYYY-MM' strings or dates and are inclusive.
+        """
+        sql = "SELECT * FROM monthly_summary WHERE 1"
+        params = []
+        if device is not None:
+            sql += " AND device = ?"
+            params.append(device)
+        if start_month is not None:
+            sql += " AND month >= ?"
+            params.append(_month(start_month))
+        if end_month is not None:
+            sql += " AND month <= ?"
+            params.append(_month(end_month))
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(str(user_id))
+        sql += " ORDER BY month, user_id"
+        with self._lock:
+            return pd.read_sql_query(sql, self.db, params=params)
+
+    def summary_counts(self, device=None, start_date=None, end_date=None):
+        """Return (check_ins, check_outs, user_ids) over an inclusive day range"""
+        where = " WHERE 1"
+        params = []
+        if device is not None:
+            where += " AND device = ?"
+            params.append(device)
+        if start_date is not None:
+            where += " AND day >= ?"
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date is not None:
+            where += " AND day <= ?"
+            params.append(end_date.strftime("%Y-%m-%d"))
+        with self._lock:
+            check_ins, check_outs = self.db.execute(
+                "SELECT COALESCE(SUM(check_ins), 0), COALESCE(SUM(check_outs), 0) FROM daily_summary" + where, params
+            ).fetchone()
+            users = self.db.execute("SELECT DISTINCT user_id FROM daily_summary" + where, params).fetchall()
+        return check_ins, check_outs, {user_id for user_id, in users}
+
+    def query(self, device, start_date=None, end_date=None):
+        """Return stored punches for a device as a DataFrame sorted by timestamp.
+
+        Columns: user_id, timestamp, raw_status, punch.
+        """
+        sql = "SELECT user_id, timestamp, raw_status, punch FROM punches WHERE device = ?"
+        params = [device]
+        if start_date is not None:
+            sql += " AND timestamp >= ?"
+            params.append(start_date.strftime(TIMESTAMP_FORMAT))
+        if end_date is not None:
+            sql += " AND timestamp <= ?"
+            params.append(end_date.strftime(TIMESTAMP_FORMAT))
+        sql += " ORDER BY timestamp"
+        with self._lock:
+            df = pd.read_sql_query(sql, self.db, params=params)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT)
+        return df
+
+    def user_snapshot(self, device):
+        """Return (users, signature, fetched_at) for a device's cached user directory.
+
+        users is a user_id -> name dict; all three are None if nothing is cached.
+        """
+        with self._lock:
+            state = self.db.execute(
+                "SELECT signature, fetched_at FROM user_state WHERE device = ?", (device,)
+            ).fetchone()
+            if not state:
+                return None, None, None
+            rows = self.db.execute(
+                "SELECT user_id, name FROM users WHERE device = ?", (device,)
+            ).fetchall()
+        return dict(rows), state[0], datetime.strptime(state[1], TIMESTAMP_FORMAT)
+
+    def user_uids(self, device):
+        """Return the cached device uid -> user_id map (needed to decode 8-byte punch records)"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT uid, user_id FROM users WHERE device = ? AND uid IS NOT NULL", (device,)
+            ).fetchall()
+        return dict(rows)
+
+    def save_users(self, device, users, signature, users_by_uid=None):
+        """Replace a device's cached user directory, with each user's device uid if given"""
+        uids = {str(user_id): uid for uid, user_id in (users_by_uid or {}).items()}
+        with self._lock:
+            self.db.execute("DELETE FROM users WHERE device = ?", (device,))
+            self.db.executemany(
+                "INSERT INTO users (device, user_id, name, uid) VALUES (?, ?, ?, ?)",
+                [(device, str(user_id), name, uids.get(str(user_id))) for user_id, name in users.items()]
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO user_state (device, signature, fetched_at) VALUES (?, ?, ?)",
+                (device, signature, datetime.now().strftime(TIMESTAMP_FORMAT))
+            )
+            self.db.commit()
+
+
+def _month(value):
+    return value if isinstance(value, str) else value.strftime("%Y-%m")
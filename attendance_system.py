@@ -1,168 +1,774 @@
 from zk import ZK, const
+import logging
+import queue
+import threading
+from struct import unpack
+import numpy as np
 import pandas as pd
 from dateutil import parser
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
+from attendance_cache import frame_bytes
+from attendance_metrics import configure_from_env, metrics
+from attendance_shifts import build_intervals
+
+log = logging.getLogger(__name__)
+
+RAW_COLUMNS = ['user_id', 'user_name', 'timestamp', 'raw_status', 'punch', 'status', 'device_name']
+PAIRED_COLUMNS = ['user_id', 'user_name', 'date', 'check_in', 'check_out', 'duration']
+ATTENDANCE_RECORD_SIZE = 40  # Bytes per punch in the device's attendance buffer
+PUNCH_STATUS = {0: "Check In", 1: "Check Out"}
+
+# Attendance buffer layouts by record size, as parsed by pyzk's get_attendance
+ATTENDANCE_DTYPES = {
+    8: np.dtype([('uid', '<u2'), ('status', 'u1'), ('timestamp', '<u4'), ('punch', 'u1')]),
+    16: np.dtype([('user_id', '<u4'), ('timestamp', '<u4'), ('status', 'u1'), ('punch', 'u1'),
+                  ('reserved', 'V2'), ('workcode', '<u4')]),
+    40: np.dtype([('uid', '<u2'), ('user_id', 'S24'), ('status', 'u1'), ('timestamp', '<u4'),
+                  ('punch', 'u1'), ('space', 'V8')]),
+}
+
+
+def punch_status(punch):
+    """Convert a punch value to its check-in/check-out label"""
+    # According to ZKTeco documentation:
+    # 0: Check In
+    # 1: Check Out
+    return PUNCH_STATUS.get(punch, f"Unknown Punch ({punch})")
+
+
+def decode_times(raw):
+    """Vectorised pyzk decode_time: device-encoded seconds -> datetime64[us].
+
+    Microseconds match the resolution pandas infers for the datetime objects
+    pyzk returns and for timestamps read back from the store.
+    """
+    raw = np.asarray(raw, dtype=np.int64)
+    seconds = raw % 86400
+    days = raw // 86400
+    months = (days // 31) % 12 + (days // (31 * 12) + 30) * 12  # Months since 1970-01
+    dates = months.astype('datetime64[M]').astype('datetime64[D]') + days % 31
+    return (dates + seconds.astype('timedelta64[s]')).astype('datetime64[us]')
+
+
+class AttendanceDecoder:
+    """Decode a device attendance buffer into compact typed columns, chunk by chunk.
+
+    feed() accepts the buffer in pieces of any size as they arrive; the first
+    four bytes hold its total size, which with the device's record count
+    gives the record layout (ATTENDANCE_DTYPES). Whole records are viewed
+    through numpy without copying and decoded chunk_records at a time into
+    preallocated columns: an int32 user code, a datetime64 timestamp and
+    uint8 status and punch. No per-record Python objects are made, so
+    scratch memory is bounded by the chunk size rather than the log size.
+    Text user ids are decoded once per distinct value; 8-byte records carry
+    only the device uid, which users_by_uid ({uid: user_id}) maps back.
+    """
+
+    def __init__(self, records, users_by_uid=None, chunk_records=65536):
+        self.expected = records
+        self.users_by_uid = users_by_uid or {}
+        self.chunk_records = chunk_records
+        self.dtype = None
+        self.count = 0
+        self.bytes = 0
+        self._header = b''
+        self._partial = b''  # Tail of a record split across two feeds
+        self._codes = {}  # Raw user id -> code
+        self._text_codes = {}  # User id text -> code; distinct raw values can decode alike
+        self._user_ids = []  # Code -> user id text
+        self._user = np.empty(records, dtype=np.int32)
+        self._timestamp = np.empty(records, dtype='datetime64[us]')
+        self._status = np.empty(records, dtype=np.uint8)
+        self._punch = np.empty(records, dtype=np.uint8)
+
+    def feed(self, data):
+        data = memoryview(data)
+        self.bytes += len(data)
+        if self.dtype is None:
+            need = 4 - len(self._header)
+            self._header += bytes(data[:need])
+            data = data[need:]
+            if len(self._header) < 4:
+                return
+            total = unpack('<I', self._header)[0]
+            record_size = total // self.expected if self.expected else ATTENDANCE_RECORD_SIZE
+            self.dtype = ATTENDANCE_DTYPES.get(record_size, ATTENDANCE_DTYPES[ATTENDANCE_RECORD_SIZE])
+        size = self.dtype.itemsize
+        if self._partial:
+            need = size - len(self._partial)
+            self._partial += bytes(data[:need])
+            data = data[need:]
+            if len(self._partial) < size:
+                return
+            self._decode(np.frombuffer(self._partial, dtype=self.dtype))
+            self._partial = b''
+        whole = len(data) - len(data) % size
+        step = self.chunk_records * size
+        for start in range(0, whole, step):
+            self._decode(np.frombuffer(data[start:min(start + step, whole)], dtype=self.dtype))
+        self._partial = bytes(data[whole:])
+
+    def _user_id(self, raw):
+        if 'user_id' not in self.dtype.names:
+            return self.users_by_uid.get(int(raw), str(raw))
+        if isinstance(raw, bytes):
+            return raw.split(b'\x00')[0].decode(errors='ignore')
+        return str(raw)
+
+    def _decode(self, records):
+        count = len(records)
+        if self.count + count > len(self._user):
+            self._grow(max(2 * len(self._user), self.count + count))
+        key = 'user_id' if 'user_id' in self.dtype.names else 'uid'
+        raw_ids, inverse = np.unique(records[key], return_inverse=True)
+        codes = np.empty(len(raw_ids), dtype=np.int32)
+        for i, raw in enumerate(raw_ids.tolist()):
+            code = self._codes.get(raw)
+            if code is None:
+                text = self._user_id(raw)
+                code = self._text_codes.get(text)
+                if code is None:
+                    code = self._text_codes[text] = len(self._user_ids)
+                    self._user_ids.append(text)
+                self._codes[raw] = code
+            codes[i] = code
+        end = self.count + count
+        self._user[self.count:end] = codes[inverse.reshape(-1)]
+        self._timestamp[self.count:end] = decode_times(records['timestamp'])
+        self._status[self.count:end] = records['status']
+        self._punch[self.count:end] = records['punch']
+        self.count = end
+
+    def _grow(self, capacity):
+        for name in ('_user', '_timestamp', '_status', '_punch'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def frame(self):
+        """Return the decoded punches as a timestamp-sorted frame (user_id, timestamp, raw_status, punch).
+
+        user_id is a categorical with sorted categories, as astype('category')
+        would give, so it costs a small integer per punch.
+        """
+        count = self.count
+        timestamps = self._timestamp[:count]
+        user_ids = np.array(self._user_ids, dtype=object)
+        order = np.argsort(user_ids)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        df = pd.DataFrame({
+            'user_id': pd.Categorical.from_codes(rank[self._user[:count]], categories=user_ids[order]),
+            'timestamp': timestamps,
+            'raw_status': self._status[:count].astype(np.int16),
+            'punch': self._punch[:count].astype(np.int16),
+        })
+        # Devices log in time order, so the sort (and its copy) is usually skipped
+        if count > 1 and (timestamps[1:] < timestamps[:-1]).any():
+            df = df.sort_values('timestamp', kind='mergesort', ignore_index=True)
+        return df
+
+
+def normalize_range(start_date, end_date):
+    """Convert date bounds to inclusive datetime bounds"""
+    if start_date and not isinstance(start_date, datetime):
+        start_date = datetime.combine(start_date, time.min)
+    if end_date and not isinstance(end_date, datetime):
+        end_date = datetime.combine(end_date, time.max)
+    return start_date, end_date
+
+
+def slice_range(df, start_date, end_date):
+    """Binary-search a timestamp-sorted frame for the inclusive date range"""
+    timestamps = df['timestamp'].values
+    lo = 0
+    hi = len(df)
+    if start_date:
+        lo = timestamps.searchsorted(np.datetime64(start_date), side='left')
+    if end_date:
+        hi = timestamps.searchsorted(np.datetime64(end_date), side='right')
+    return df.iloc[lo:hi].reset_index(drop=True)
+
+
+def decorate_raw(df, users, device_name):
+    """Add categorical user_name, status and device_name columns to a punch frame"""
+    # Names and statuses are resolved once per distinct value, not per punch
+    user_ids = df['user_id'].astype('category').cat.remove_unused_categories()
+    names = np.array([users.get(uid, "Unknown") for uid in user_ids.cat.categories], dtype=object)
+    punches = df['punch'].astype('category')
+    statuses = np.array([punch_status(p) for p in punches.cat.categories], dtype=object)
+    df['user_id'] = user_ids
+    df['user_name'] = pd.Categorical(names[user_ids.cat.codes.values])
+    df['status'] = pd.Categorical(statuses[punches.cat.codes.values])
+    df['device_name'] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[device_name])
+    return df[RAW_COLUMNS]
+
+
+def pair_attendance(df):
+    """Group raw punches into one check-in/check-out row per user per day.
+
+    Within a (user_id, date) group the latest Check In punch becomes
+    check_in and the latest Check Out punch becomes check_out; days without
+    a check-in are dropped. Works on whole columns via groupby, so the cost
+    is a sort plus a single aggregation pass.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=PAIRED_COLUMNS)
+
+    timestamps = pd.to_datetime(df['timestamp'])
+    frame = pd.DataFrame({
+        'user_id': df['user_id'].values,
+        'user_name': df['user_name'].values,
+        'day': timestamps.dt.normalize().values,
+        'timestamp': timestamps.values,
+        'check_in': timestamps.where(df['punch'] == 0).values,
+        'check_out': timestamps.where(df['punch'] == 1).values,
+    })
+    frame = frame.sort_values(['user_id', 'timestamp'], kind='mergesort')
+
+    # GroupBy.last skips NaT, so it picks the latest punch of each kind
+    result_df = frame.groupby(['user_id', 'day'], sort=True, observed=True).agg(
+        user_name=('user_name', 'first'),
+        check_in=('check_in', 'last'),
+        check_out=('check_out', 'last'),
+    ).reset_index()
+    result_df = result_df[result_df['check_in'].notna()].reset_index(drop=True)
+    if result_df.empty:
+        return pd.DataFrame(columns=PAIRED_COLUMNS)
+
+    result_df['user_id'] = result_df['user_id'].astype(object)
+    result_df['user_name'] = result_df['user_name'].astype(object)
+    result_df['date'] = result_df['day'].dt.date
+    result_df['duration'] = (result_df['check_out'] - result_df['check_in']).dt.total_seconds() / 3600
+    return result_df[PAIRED_COLUMNS]
+
+
+class UserIndex:
+    """Row positions of each user in a frame, for drill-downs without boolean scans.
+
+    Built once per frame with a stable argsort of the user codes, so each
+    user's positions stay in frame order. A lookup is a dict probe plus a
+    slice, proportional to that user's rows. Keys are compared as strings,
+    matching the values shown in the Treeview.
+    """
+
+    def __init__(self, frame, column='user_id'):
+        self.frame = frame
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.values
+            keys = values.cat.categories
+        else:
+            codes, keys = pd.factorize(values)
+        self._order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(keys))
+        # Missing user ids (code -1) sort first and are never looked up
+        self._stops = int((codes < 0).sum()) + np.cumsum(counts)
+        self._starts = self._stops - counts
+        self._lookup = {str(key): i for i, key in enumerate(keys) if counts[i]}
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._lookup
+
+    def __len__(self):
+        return len(self._lookup)
+
+    def users(self):
+        return list(self._lookup)
+
+    def positions(self, user_id):
+        """Return the frame positions of a user's rows (empty if unknown)"""
+        i = self._lookup.get(str(user_id))
+        if i is None:
+            return self._order[:0]
+        return self._order[self._starts[i]:self._stops[i]]
+
+    def get(self, user_id):
+        """Return a user's rows in frame order"""
+        return self.frame.iloc[self.positions(user_id)]
+
+    def __iter__(self):
+        """Yield (user_id, rows) for every user, e.g. for per-user exports"""
+        for user_id in self._lookup:
+            yield user_id, self.get(user_id)
+
 
 class ZKTecoAttendance:
-    def __init__(self, ip_address, port=4370, timeout=5, password=0):
+    def __init__(self, ip_address, port=4370, timeout=5, password=0, store=None, user_cache_ttl=24 * 3600,
+                 ommit_ping=False, cache=None):
         self.ip_address = ip_address
         self.port = port
         self.timeout = timeout
         self.password = password
-        self.zk = ZK(self.ip_address, port=self.port, timeout=self.timeout, password=self.password)
+        # ommit_ping skips pyzk's ICMP pre-check, e.g. for a local simulator
+        self.zk = ZK(self.ip_address, port=self.port, timeout=self.timeout, password=self.password,
+                     ommit_ping=ommit_ping)
         self.conn = None
         self.users = {}  # Cache for user information
+        self.users_by_uid = {}  # Device uid -> user_id, for terminals with 8-byte attendance records
+        self.store = store  # Optional AttendanceStore for incremental sync
+        self.user_cache_ttl = user_cache_ttl  # Seconds before a cached user directory is re-downloaded
+        self.cache = cache  # Optional ResultCache of raw and paired frames, shared across devices
+        self._users_version = None  # Changes whenever the loaded user directory does
+        self.device_key = f"{self.ip_address}:{self.port}"
+        self.last_error = None  # Message of the last failed connect
+        self.live_events = None  # Queue of punches while live capture runs
+        self._live_thread = None
+        self._live_stop = None
 
     def connect(self):
         try:
-            self.conn = self.zk.connect()
+            with metrics.stage("connect", self.device_key):
+                self.conn = self.zk.connect()
+            self.last_error = None
             # Load user information
             self.load_users()
-            print(f"Successfully connected to device at {self.ip_address}")
+            log.info("Successfully connected to device at %s", self.ip_address)
         except Exception as e:
-            print(f"Error connecting to device: {str(e)}")
+            log.error("Error connecting to device %s: %s", self.device_key, e)
+            self.last_error = str(e)
             self.conn = None
 
     def disconnect(self):
+        if self._live_thread:
+            self.stop_live_capture()
         if self.conn:
             self.conn.disconnect()
-            print("Disconnected from device")
+            log.info("Disconnected from device %s", self.ip_address)
             self.conn = None
             self.users = {}
+            self.users_by_uid = {}
+            self._users_version = None
 
-    def load_users(self):
-        """Load all users from the device"""
+    def load_users(self, force=False):
+        """Load all users from the device, reusing the stored directory when unchanged"""
         if not self.conn:
             return
         try:
-            users = self.conn.get_users()
-            self.users = {user.user_id: user.name for user in users}
-            print(f"Loaded {len(self.users)} users from device")
+            with metrics.stage("load_users", self.device_key) as stage:
+                signature = None
+                if self.store:
+                    # User counters are a single small packet; a changed count or
+                    # free-slot figure means users were enrolled or deleted
+                    self.conn.read_sizes()
+                    signature = f"{self.conn.users}/{self.conn.users_cap}/{self.conn.users_av}"
+                    cached, cached_signature, fetched_at = self.store.user_snapshot(self.device_key)
+                    fresh = fetched_at is not None and (datetime.now() - fetched_at).total_seconds() < self.user_cache_ttl
+                    uids = self.store.user_uids(self.device_key)
+                    # Snapshots saved before uids were kept cannot decode 8-byte records
+                    complete = cached is not None and len(uids) == len(cached)
+                    if not force and complete and cached_signature == signature and fresh:
+                        self.users = cached
+                        self.users_by_uid = uids
+                        self._users_version = hash(frozenset(self.users.items()))
+                        stage.records = len(self.users)
+                        log.info("Loaded %d users from local cache", len(self.users))
+                        return
+                users = self.conn.get_users()
+                self.users = {user.user_id: user.name for user in users}
+                self.users_by_uid = {user.uid: user.user_id for user in users}
+                self._users_version = hash(frozenset(self.users.items()))
+                stage.records = len(self.users)
+                stage.bytes = len(users) * int(self.conn.user_packet_size)
+                log.info("Loaded %d users from device", len(self.users))
+                if self.store:
+                    self.store.save_users(self.device_key, self.users, signature, self.users_by_uid)
         except Exception as e:
-            print(f"Error loading users: {str(e)}")
+            log.error("Error loading users: %s", e)
 
     def get_attendance_status(self, punch):
         """Convert punch value to check-in/check-out status"""
-        # According to ZKTeco documentation:
-        # 0: Check In
-        # 1: Check Out
-        punch_map = {
-            0: "Check In",
-            1: "Check Out"
-        }
-        return punch_map.get(punch, f"Unknown Punch ({punch})")
+        return punch_status(punch)
+
+    def sync(self):
+        """Pull punches newer than the store's high-water mark into the local store.
+
+        Returns the number of new punches. Device and store errors are logged
+        and raised, so a failed pull is never reported as "nothing new".
+        """
+        if not self.conn or not self.store:
+            return 0
+        try:
+            with metrics.stage("sync", self.device_key) as stage:
+                # The record counter is cheap to read; skip the buffer download
+                # entirely when nothing was punched since the last sync
+                self.conn.read_sizes()
+                device_records = self.conn.records
+                if self.store.record_count(self.device_key) == device_records:
+                    stage.records = 0
+                    log.info("Local attendance store is up to date")
+                    return 0
+                punches = self._download()
+                inserted = self.store.ingest(self.device_key, punches, record_count=device_records)
+                stage.records = inserted
+                log.info("Synced %d new attendance records into local store", inserted)
+                return inserted
+        except Exception as e:
+            log.error("Error syncing attendance records: %s", e)
+            raise
+
+    def archive_and_purge(self, archive_dir="archive", verify_download=True):
+        """Archive the device's attendance log locally, verify it, then clear the device log.
+
+        The device is disabled meanwhile so no punch lands between download
+        and clear. The raw buffer is written durably (attendance_archive)
+        and read back from disk, and the log is only cleared when the
+        archive's record count matches the device counter and its checksum
+        matches the download and, with verify_download, a second download.
+        With a store, the punches are synced into it first. Returns the
+        archive manifest (None if the log was empty); raises ArchiveError
+        and leaves the device log untouched when a check fails.
+        """
+        from attendance_archive import ArchiveError, verify_archive, write_archive
 
-    def get_attendance(self, start_date=None, end_date=None):
         if not self.conn:
-            print("Not connected to device. Please connect first.")
+            raise ArchiveError("Not connected to device")
+        with metrics.stage("archive", self.device_key) as stage:
+            self.conn.disable_device()
+            try:
+                self.conn.read_sizes()
+                records = self.conn.records
+                if not records:
+                    log.info("Attendance log on %s is empty; nothing to archive", self.ip_address)
+                    return None
+                data, _ = self.conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+                manifest = write_archive(archive_dir, self.device_key, data, records)
+                verify_archive(manifest['path'], records=records)
+                if verify_download:
+                    again, _ = self.conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+                    if again != data:
+                        raise ArchiveError("Second download differs from the archived buffer")
+                    del again
+                if self.store:
+                    decoder = AttendanceDecoder(records, self.users_by_uid)
+                    decoder.feed(data)
+                    self.store.ingest(self.device_key, decoder.frame(), record_count=records)
+                del data
+                self.conn.read_sizes()
+                if self.conn.records != records:
+                    raise ArchiveError(f"Device log changed during archive ({records} -> {self.conn.records})")
+                self.conn.clear_attendance()
+                self.conn.read_sizes()
+                if self.store:
+                    self.store.set_record_count(self.device_key, self.conn.records)
+                if self.cache is not None:
+                    # The record counter restarts, so earlier versions could repeat
+                    self.cache.invalidate(self.device_key)
+                stage.records = records
+                stage.bytes = manifest['bytes']
+                log.info("Archived %d records from %s to %s and cleared the device log",
+                         records, self.ip_address, manifest['path'])
+                return manifest
+            finally:
+                self.conn.enable_device()
+
+    def _download(self, chunk_records=65536):
+        """Read the device's attendance buffer and decode it into a punch frame.
+
+        pyzk's get_attendance builds an Attendance object per record (and
+        matches each against the user list); here the raw buffer goes
+        through AttendanceDecoder instead. pyzk still joins the buffer's
+        chunks into one bytes object, which is released after decoding.
+        """
+        with metrics.stage("download", self.device_key) as stage:
+            self.conn.read_sizes()
+            decoder = AttendanceDecoder(self.conn.records, self.users_by_uid, chunk_records)
+            if self.conn.records:
+                data, _ = self.conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+                decoder.feed(data)
+                del data
+            stage.records = decoder.count
+            stage.bytes = decoder.bytes
+        return decoder.frame()
+
+    def _log_version(self):
+        """Cache marker for the current log: the device's record count and the user directory.
+
+        Reading the record counter is a single small packet. Returns None
+        without a result cache.
+        """
+        if self.cache is None:
+            return None
+        self.conn.read_sizes()
+        return self.conn.records, self._users_version
+
+    def _cached(self, kind, start_date, end_date, version):
+        if version is None:
+            return None
+        frame = self.cache.get((self.device_key, kind, start_date, end_date, version))
+        if frame is not None:
+            log.info("Using %d cached %s records", len(frame), kind)
+        return frame
+
+    def _remember(self, kind, start_date, end_date, version, frame):
+        if version is not None and frame is not None:
+            self.cache.put((self.device_key, kind, start_date, end_date, version), frame)
+
+    def get_raw_attendance(self, start_date=None, end_date=None, device_name=None):
+        """Return individual punches in the date range as a compact columnar frame.
+
+        Columns: user_id, user_name, timestamp, raw_status, punch, status and
+        device_name. The text columns are categoricals and the frame is sorted
+        by timestamp. Returns None when no punches match; device and store
+        errors are logged and raised, so callers can tell a failure apart.
+        """
+        if not self.conn:
+            log.warning("Not connected to device. Please connect first.")
             return None
         try:
-            attendance = self.conn.get_attendance()
-            if not attendance:
-                print("No attendance records found")
+            start_date, end_date = normalize_range(start_date, end_date)
+            df = self._raw_attendance(start_date, end_date, self._log_version())
+            if df is not None and device_name and device_name != self.device_key:
+                df['device_name'] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[device_name])
+            return df
+        except Exception as e:
+            log.error("Error retrieving raw attendance records: %s", e)
+            raise
+
+    def _raw_attendance(self, start_date, end_date, version):
+        """Decorated punches in a normalized range, tagged with device_key, via the result cache"""
+        cached = self._cached('raw', start_date, end_date, version)
+        if cached is not None:
+            return cached
+        if self.store:
+            self.sync()
+            with metrics.stage("query", self.device_key) as stage:
+                df = self.store.query(self.device_key, start_date, end_date)
+                stage.records = len(df)
+        else:
+            punches = self._download()
+            if punches.empty:
+                log.info("No attendance records found")
                 return None
+            log.info("Retrieved %d attendance records", len(punches))
+            with metrics.stage("frame", self.device_key) as stage:
+                df = slice_range(punches, start_date, end_date)
+                del punches
+                stage.records = len(df)
+        if df.empty:
+            log.info("No attendance records found")
+            return None
 
-            print(f"Retrieved {len(attendance)} attendance records")
-            
-            # Convert dates to datetime objects if they're not already
-            if start_date and not isinstance(start_date, datetime):
-                start_date = datetime.combine(start_date, time.min)
-            if end_date and not isinstance(end_date, datetime):
-                end_date = datetime.combine(end_date, time.max)
-
-            # First, collect all records
-            raw_records = []
-            for att in attendance:
-                dt = att.timestamp
-                if start_date and end_date:
-                    if not (start_date <= dt <= end_date):
-                        continue
-                user_name = self.users.get(att.user_id, "Unknown")
-                raw_records.append({
-                    'user_id': att.user_id,
-                    'user_name': user_name,
-                    'timestamp': dt,
-                    'raw_status': att.status,
-                    'punch': att.punch,
-                    'status': self.get_attendance_status(att.punch)
-                })
+        log.info("Selected %d attendance records in range", len(df))
+        with metrics.stage("decorate", self.device_key) as stage:
+            stage.records = len(df)
+            df = decorate_raw(df, self.users, self.device_key)
+        self._remember('raw', start_date, end_date, version, df)
+        return df.copy(deep=False) if version is not None else df
+
+    def get_intervals(self, start_date=None, end_date=None, shifts=None, max_shift_hours=16, device_name=None):
+        """Return every in/out interval whose business date falls in the range.
+
+        See attendance_shifts.build_intervals. Punches are fetched with
+        max_shift_hours of padding on both sides, so shifts crossing the
+        range boundaries are paired whole.
+        """
+        start_date, end_date = normalize_range(start_date, end_date)
+        padding = timedelta(hours=max_shift_hours)
+        df = self.get_raw_attendance(
+            start_date - padding if start_date else None,
+            end_date + padding if end_date else None,
+            device_name=device_name
+        )
+        with metrics.stage("intervals", self.device_key) as stage:
+            intervals = build_intervals(df, shifts, max_shift_hours=max_shift_hours)
+            if start_date:
+                intervals = intervals[intervals['date'] >= start_date.date()]
+            if end_date:
+                intervals = intervals[intervals['date'] <= end_date.date()]
+            stage.records = len(intervals)
+        return intervals.reset_index(drop=True)
+
+    def get_daily_summary(self, start_date=None, end_date=None):
+        """Return per-user daily summaries from the local store, or None without one"""
+        if not self.store:
+            return None
+        self.sync()
+        return self.store.daily_summary(self.device_key, start_date, end_date)
+
+    def get_monthly_summary(self, start_month=None, end_month=None):
+        """Return per-user monthly summaries from the local store, or None without one"""
+        if not self.store:
+            return None
+        self.sync()
+        return self.store.monthly_summary(self.device_key, start_month, end_month)
+
+    def get_stored_attendance(self, start_date=None, end_date=None, device_name=None):
+        """Return raw punches from the local store without contacting the device.
+
+        Same columns as get_raw_attendance; user names come from the stored
+        user directory. Returns None without a store or when nothing matches.
+        """
+        if not self.store:
+            return None
+        if not self.users:
+            self.users = self.store.user_snapshot(self.device_key)[0] or {}
+        start_date, end_date = normalize_range(start_date, end_date)
+        with metrics.stage("query", self.device_key) as stage:
+            df = self.store.query(self.device_key, start_date, end_date)
+            stage.records = len(df)
+        if df.empty:
+            return None
+        return decorate_raw(df, self.users, device_name or self.device_key)
 
-            # Convert to DataFrame for easier manipulation
-            df = pd.DataFrame(raw_records)
-            if df.empty:
+    def get_attendance(self, start_date=None, end_date=None):
+        """Return paired check-in/check-out rows per user per day (see pair_attendance).
+
+        With a result cache, a range already paired for the same log
+        version is returned without contacting the store or pairing again.
+        Errors are raised as in get_raw_attendance.
+        """
+        if not self.conn:
+            log.warning("Not connected to device. Please connect first.")
+            return None
+        try:
+            start_date, end_date = normalize_range(start_date, end_date)
+            version = self._log_version()
+            cached = self._cached('paired', start_date, end_date, version)
+            if cached is not None:
+                return cached
+            df = self._raw_attendance(start_date, end_date, version)
+            if df is None:
                 return None
 
-            # Sort by user_id and timestamp
-            df = df.sort_values(['user_id', 'timestamp'])
-
-            # Group records by user and date
-            grouped_records = []
-            current_user = None
-            current_date = None
-            check_in = None
-            check_out = None
-
-            for _, row in df.iterrows():
-                user_id = row['user_id']
-                user_name = row['user_name']
-                timestamp = row['timestamp']
-                date = timestamp.date()
-                punch = row['punch']
-
-                # If new user or new date, save previous record and start new one
-                if current_user != user_id or current_date != date:
-                    if current_user is not None and check_in is not None:
-                        grouped_records.append({
-                            'user_id': current_user,
-                            'user_name': current_user_name,
-                            'date': current_date,
-                            'check_in': check_in,
-                            'check_out': check_out
-                        })
-                    current_user = user_id
-                    current_user_name = user_name
-                    current_date = date
-                    check_in = None
-                    check_out = None
-
-                # Update check-in or check-out time
-                if punch == 0:  # Check In
-                    check_in = timestamp
-                elif punch == 1:  # Check Out
-                    check_out = timestamp
-
-            # Add the last record
-            if current_user is not None and check_in is not None:
-                grouped_records.append({
-                    'user_id': current_user,
-                    'user_name': current_user_name,
-                    'date': current_date,
-                    'check_in': check_in,
-                    'check_out': check_out
-                })
+            # Pair check-ins and check-outs per user per day
+            with metrics.stage("pair", self.device_key) as stage:
+                result_df = pair_attendance(df)
+                stage.records = len(result_df)
+            self._remember('paired', start_date, end_date, version, result_df)
+            if version is not None:
+                result_df = result_df.copy(deep=False)
 
-            # Convert to DataFrame
-            result_df = pd.DataFrame(grouped_records)
-            
-            # Calculate duration if both check-in and check-out are present
-            if not result_df.empty:
-                result_df['duration'] = result_df.apply(
-                    lambda row: (row['check_out'] - row['check_in']).total_seconds() / 3600 
-                    if pd.notnull(row['check_out']) else None, 
-                    axis=1
-                )
-
-            print(f"\nGrouped into {len(result_df)} attendance records")
-            if not result_df.empty:
-                print("\nSample of grouped records:")
-                print(result_df.head())
+            log.info("Grouped into %d attendance records", len(result_df))
+            if not result_df.empty and log.isEnabledFor(logging.DEBUG):
+                log.debug("Sample of grouped records:\n%s", result_df.head())
             return result_df
 
         except Exception as e:
-            print(f"Error retrieving attendance records: {str(e)}")
-            return None
+            log.error("Error retrieving attendance records: %s", e)
+            raise
+
+    def iter_attendance(self, start_date=None, end_date=None, device_name=None, days_per_chunk=7, rows_per_chunk=50000):
+        """Yield paired attendance (with device_name) in consecutive chunks.
+
+        With a local store and a bounded date range, each chunk is a separate
+        indexed query over days_per_chunk days, so only one window of punches
+        is in memory at a time. Pairing is per user per day and windows are
+        aligned to midnight, so the chunks add up to get_attendance's rows.
+        Without a store the device buffer is paired once and yielded in
+        slices of rows_per_chunk rows, as is a range that is in the result
+        cache (paired, or raw from an earlier get_raw_attendance). Windows
+        read from the store are cached too, re-sorted into get_attendance's
+        order, if they fit the cache.
+        """
+        if not self.conn:
+            log.warning("Not connected to device. Please connect first.")
+            return
+        start_date, end_date = normalize_range(start_date, end_date)
+        device_name = device_name or self.device_key
+        version = self._log_version()
+        cached = version is not None and any((self.device_key, kind, start_date, end_date, version) in self.cache
+                                             for kind in ('paired', 'raw'))
+        if cached or not self.store or start_date is None or end_date is None:
+            records = self.get_attendance(start_date, end_date)
+            if records is None or records.empty:
+                return
+            records['device_name'] = device_name
+            for start in range(0, len(records), rows_per_chunk):
+                yield records.iloc[start:start + rows_per_chunk]
+            return
+
+        self.sync()
+        chunks = [] if version is not None else None
+        chunk_bytes = 0
+        window_start = start_date
+        while window_start <= end_date:
+            last_day = window_start.date() + timedelta(days=days_per_chunk - 1)
+            window_end = min(datetime.combine(last_day, time.max), end_date)
+            with metrics.stage("query", self.device_key) as stage:
+                df = self.store.query(self.device_key, window_start, window_end)
+                stage.records = len(df)
+            if not df.empty:
+                with metrics.stage("pair", self.device_key) as stage:
+                    paired = pair_attendance(decorate_raw(df, self.users, device_name))
+                    stage.records = len(paired)
+                if not paired.empty:
+                    if chunks is not None:
+                        chunk_bytes += frame_bytes(paired)
+                        chunks = chunks if chunk_bytes <= self.cache.max_bytes else None
+                    if chunks is not None:
+                        chunks.append(paired.copy(deep=False))
+                    paired['device_name'] = device_name
+                    yield paired
+            window_start = datetime.combine(last_day + timedelta(days=1), time.min)
+        if chunks:
+            paired = pd.concat(chunks, ignore_index=True)
+            self._remember('paired', start_date, end_date, version,
+                           paired.sort_values(['user_id', 'date'], kind='mergesort', ignore_index=True))
+
+    def live_capture(self, events, device_name=None, should_stop=None, poll_timeout=1):
+        """Push each punch into the `events` queue as the device reports it.
+
+        Blocks until should_stop() returns True (checked at least every
+        poll_timeout seconds) or the connection fails. Each event is a dict
+        with the RAW_COLUMNS keys. Punches are also written to the local
+        store, which then re-syncs on the next fetch.
+        """
+        if not self.conn:
+            log.warning("Not connected to device. Please connect first.")
+            return
+        device_name = device_name or self.device_key
+        log.info("Live capture started on %s", self.ip_address)
+        try:
+            for att in self.conn.live_capture(new_timeout=poll_timeout):
+                if should_stop and should_stop():
+                    self.conn.end_live_capture = True
+                    continue
+                if att is None:
+                    continue
+                if self.store:
+                    # Punches from before live mode may not be synced yet; keep the sync mark
+                    self.store.ingest(self.device_key, [att], advance=False)
+                events.put({
+                    'user_id': att.user_id,
+                    'user_name': self.users.get(att.user_id, "Unknown"),
+                    'timestamp': att.timestamp,
+                    'raw_status': att.status,
+                    'punch': att.punch,
+                    'status': self.get_attendance_status(att.punch),
+                    'device_name': device_name,
+                })
+        except Exception as e:
+            log.error("Error during live capture: %s", e)
+            raise
+        finally:
+            log.info("Live capture stopped on %s", self.ip_address)
+
+    def start_live_capture(self, device_name=None, poll_timeout=1):
+        """Run live_capture on a background thread and return its event queue"""
+        if self._live_thread and self._live_thread.is_alive():
+            return self.live_events
+        self.live_events = queue.Queue()
+        self._live_stop = threading.Event()
+        self._live_thread = threading.Thread(
+            target=self.live_capture,
+            args=(self.live_events, device_name, self._live_stop.is_set, poll_timeout),
+            name=f"live-{self.device_key}",
+            daemon=True
+        )
+        self._live_thread.start()
+        return self.live_events
+
+    def stop_live_capture(self, timeout=5):
+        if self._live_thread:
+            self._live_stop.set()
+            self._live_thread.join(timeout)
+            self._live_thread = None
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    configure_from_env()
     device_ip = "192.168.1.201"  # Replace with your device's IP address
     attendance_system = ZKTecoAttendance(device_ip)
     try:
@@ -0,0 +1,206 @@
+import tkinter as tk
+from tkinter import ttk
+import numpy as np
+import pandas as pd
+
+
+def _label_ranks(labels):
+    """Rank labels with numeric text (e.g. user ids) by value first, then the rest as text"""
+    text = np.asarray(labels.astype(str), dtype=object)
+    numbers = pd.to_numeric(pd.Series(text), errors='coerce').values
+    by_text = np.empty(len(text), dtype=np.int64)
+    by_text[np.argsort(text, kind='stable')] = np.arange(len(text))
+    order = np.lexsort((by_text, np.nan_to_num(numbers), np.isnan(numbers)))
+    ranks = np.empty(len(text), dtype=np.int64)
+    ranks[order] = np.arange(len(text))
+    return ranks
+
+
+def sort_key(values):
+    """Return (rank, missing) arrays that order a column by its real type.
+
+    Numbers, timestamps and durations sort by value and text by label, with
+    numeric text by value. Missing cells are flagged separately so they can
+    stay last in either direction.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.values
+        # Rank the few categories, then look the rows up by code
+        ranks = np.append(_label_ranks(values.cat.categories), 0)
+        return ranks[codes], codes < 0
+    missing = values.isna().values
+    if values.dtype.kind in 'mM':
+        rank = values.values.view(np.int64).copy()
+    elif values.dtype.kind in 'biuf':
+        rank = values.values.astype(np.float64)
+    else:
+        codes, labels = pd.factorize(values)
+        rank = np.append(_label_ranks(labels), 0)[codes]
+    rank[missing] = 0
+    return rank, missing
+
+
+def sort_frame(frame, keys, column=None):
+    """Stable sort of frame by keys, a list of (column, ascending) pairs, first key first.
+
+    column(frame, name) returns the values to sort by for name (default
+    frame[name]), so displayed columns can sort by an underlying typed one.
+    Rows equal on every key keep their order. Runs as one np.lexsort.
+    """
+    if frame is None or not keys:
+        return frame
+    lex = []
+    for name, ascending in reversed(keys):
+        rank, missing = sort_key(frame[name] if column is None else column(frame, name))
+        lex.append(rank if ascending else -rank)
+        lex.append(missing)
+    return frame.take(np.lexsort(lex)).reset_index(drop=True)
+
+
+class VirtualTable:
+    """Shows a DataFrame in a Treeview while only materializing visible rows.
+
+    The DataFrame stays the model. The Treeview holds one item per visible
+    line and those items are rewritten in place as the user scrolls; the
+    scrollbar is driven from the model's length instead of the Treeview's.
+    Display values are produced by ``formatter(frame_slice)``, which returns
+    ``(rows, tags)`` for a slice, and formatted slices are cached with a
+    ``buffer`` of rows on each side of the view so small scrolls reuse them.
+    Sorting reorders the model (see sort_frame); ``sort_column`` maps a
+    displayed column to the values it sorts by.
+    """
+
+    def __init__(self, tree, scrollbar, formatter, buffer=50, sort_column=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.formatter = formatter
+        self.buffer = buffer
+        self.sort_column = sort_column
+        self.sort_keys = []  # (column, ascending) pairs of the current order
+        self.data = None
+        self.offset = 0
+        self.page_size = int(str(tree.cget('height'))) or 10
+        self._iids = []
+        self._cache_start = 0
+        self._cache_rows = []
+        self._cache_tags = []
+
+        tree.configure(yscrollcommand='')
+        scrollbar.config(command=self.yview)
+        tree.bind('<MouseWheel>', self._on_mousewheel)
+        tree.bind('<Button-4>', lambda e: self.yview('scroll', -3, 'units'))
+        tree.bind('<Button-5>', lambda e: self.yview('scroll', 3, 'units'))
+        tree.bind('<Configure>', self._on_resize, add='+')
+        tree.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        tree.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+        tree.bind('<Home>', lambda e: self.yview('moveto', 0))
+        tree.bind('<End>', lambda e: self.yview('moveto', 1))
+
+    def __len__(self):
+        return 0 if self.data is None else len(self.data)
+
+    def set_data(self, data):
+        """Replace the model and show it from the top"""
+        self.data = None if data is None else data.reset_index(drop=True)
+        self.sort_keys = []
+        self.offset = 0
+        self._invalidate()
+        self._render()
+
+    def append(self, rows):
+        """Add rows to the end of the model, following them if the view was at the bottom"""
+        if self.data is None or self.data.empty:
+            self.set_data(rows)
+            return
+        at_bottom = self.offset + self.page_size >= len(self.data)
+        self.data = pd.concat([self.data, rows], ignore_index=True)
+        if at_bottom:
+            self.offset = max(0, len(self.data) - self.page_size)
+        self._render()
+
+    def clear(self):
+        self.set_data(None)
+
+    def sort(self, keys):
+        """Reorder the model by keys, a list of (column, ascending) pairs, and redraw the view"""
+        self.data = sort_frame(self.data, keys, self.sort_column)
+        self.sort_keys = list(keys)
+        self.refresh()
+
+    def refresh(self):
+        """Re-render after the model was reordered in place"""
+        self._invalidate()
+        self._render()
+
+    def row_index(self, iid):
+        """Return the model position of a materialized Treeview item, or None"""
+        if iid not in self._iids:
+            return None
+        index = self.offset + self._iids.index(iid)
+        return index if index < len(self) else None
+
+    def yview(self, *args):
+        total = len(self)
+        if not args or total == 0:
+            return
+        max_offset = max(0, total - self.page_size)
+        if args[0] == 'moveto':
+            offset = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = self.page_size if args[2] == 'pages' else 1
+            offset = self.offset + int(args[1]) * step
+        else:
+            return
+        offset = min(max(0, offset), max_offset)
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_mousewheel(self, event):
+        self.yview('scroll', -3 if event.delta > 0 else 3, 'units')
+        return 'break'
+
+    def _on_resize(self, event):
+        style = ttk.Style(self.tree)
+        row_height = int(style.lookup('Treeview', 'rowheight') or 20)
+        # Leave room for the heading row
+        page_size = max(1, (event.height - row_height) // row_height)
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self._render()
+
+    def _invalidate(self):
+        self._cache_start = 0
+        self._cache_rows = []
+        self._cache_tags = []
+
+    def _window(self, start, stop):
+        """Return formatted rows and tags for model rows [start, stop)"""
+        cache_stop = self._cache_start + len(self._cache_rows)
+        if start < self._cache_start or stop > cache_stop:
+            self._cache_start = max(0, start - self.buffer)
+            rows, tags = self.formatter(self.data.iloc[self._cache_start:min(len(self), stop + self.buffer)])
+            self._cache_rows = list(rows)
+            self._cache_tags = list(tags)
+        lo = start - self._cache_start
+        hi = stop - self._cache_start
+        return self._cache_rows[lo:hi], self._cache_tags[lo:hi]
+
+    def _render(self):
+        total = len(self)
+        stop = min(total, self.offset + self.page_size)
+        rows, tags = self._window(self.offset, stop) if total else ([], [])
+
+        # Reuse existing items; only add or remove the difference
+        while len(self._iids) < len(rows):
+            self._iids.append(self.tree.insert('', tk.END, values=()))
+        if len(self._iids) > len(rows):
+            self.tree.delete(*self._iids[len(rows):])
+            del self._iids[len(rows):]
+        for iid, values, tag in zip(self._iids, rows, tags):
+            self.tree.item(iid, values=values, tags=(tag,) if tag else ())
+
+        if total:
+            self.scrollbar.set(self.offset / total, stop / total)
+        else:
+            self.scrollbar.set(0, 1)
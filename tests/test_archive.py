@@ -0,0 +1,56 @@
+"""archive_and_purge against the simulated device and a local store"""
+import numpy as np
+import pytest
+import attendance_archive
+from attendance_archive import ArchiveError
+from attendance_simulator import start_simulator
+from attendance_store import AttendanceStore
+from attendance_system import ZKTecoAttendance
+
+
+@pytest.fixture
+def device(tmp_path):
+    """A connected ZKTecoAttendance with a store, already synced with the simulator"""
+    server = start_simulator(port=0, users=5, punches=200)
+    store = AttendanceStore(str(tmp_path / "attendance.db"))
+    system = ZKTecoAttendance("127.0.0.1", port=server.server_address[1], store=store, ommit_ping=True)
+    system.connect()
+    assert system.conn
+    assert system.sync() == 200
+    try:
+        yield server, store, system
+    finally:
+        system.disconnect()
+        store.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_failed_verification_leaves_device_and_store_untouched(device, tmp_path, monkeypatch):
+    server, store, system = device
+    for _ in range(3):
+        server.device.live_punch()  # Not synced yet, so archiving would ingest them
+    log_before = server.device.attendance.copy()
+    rows_before = store.query(system.device_key)
+    count_before = store.record_count(system.device_key)
+
+    def fail(*args, **kwargs):
+        raise ArchiveError("Archive checksum mismatch")
+    monkeypatch.setattr(attendance_archive, "verify_archive", fail)
+    with pytest.raises(ArchiveError):
+        system.archive_and_purge(str(tmp_path / "archive"))
+
+    assert np.array_equal(server.device.attendance, log_before)
+    assert store.record_count(system.device_key) == count_before
+    assert store.query(system.device_key).equals(rows_before)
+
+
+def test_archive_clears_device_and_next_sync_is_empty(device, tmp_path):
+    server, store, system = device
+    server.device.live_punch()
+    manifest = system.archive_and_purge(str(tmp_path / "archive"))
+    assert manifest['records'] == 201
+    assert len(store.query(system.device_key)) == 201
+    assert len(server.device.attendance) == 0
+    assert store.record_count(system.device_key) == 0
+    assert system.sync() == 0
@@ -0,0 +1,61 @@
+"""AsyncZK request packets against pyzk and the simulator's checksum check"""
+import asyncio
+import socket
+from struct import pack, unpack
+import pytest
+from zk import ZK, const
+from attendance_async import CMD_READ_BUFFER, CMD_READ_CHUNK, AsyncZKTecoAttendance, _request
+from attendance_simulator import start_simulator
+
+
+@pytest.mark.parametrize("command, payload", [
+    (const.CMD_CONNECT, b''),
+    (const.CMD_GET_FREE_SIZES, b''),
+    (const.CMD_AUTH, b'\x01\x02\x03\x04'),
+    (CMD_READ_BUFFER, pack('<bhii', 1, const.CMD_ATTLOG_RRQ, 0, 0)),
+    (CMD_READ_CHUNK, pack('<ii', 0, 65472)),
+    (const.CMD_USERTEMP_RRQ, b'\x05'),  # Odd length
+])
+@pytest.mark.parametrize("reply_id", [const.USHRT_MAX - 1, 0, 1, 12345, const.USHRT_MAX - 2])
+def test_request_matches_pyzk_create_header(command, payload, reply_id):
+    session_id = 0x1d2c
+    expected = ZK("127.0.0.1")._ZK__create_header(command, payload, session_id, reply_id)
+    assert _request(command, payload, session_id, reply_id) == expected
+
+
+def test_simulator_refuses_a_bad_checksum():
+    server = start_simulator(port=0, users=2, punches=2)
+    try:
+        body = bytearray(_request(const.CMD_CONNECT, b'', 0, const.USHRT_MAX - 1))
+        body[2] ^= 0xFF  # Corrupt the checksum
+        with socket.create_connection(server.server_address, timeout=5) as sock:
+            sock.sendall(pack('<HHI', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2, len(body)) + body)
+            reply = sock.recv(1024)
+        assert unpack('<H', reply[8:10])[0] == const.CMD_ACK_ERROR
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_clients_pass_the_simulator_checksum():
+    server = start_simulator(port=0, users=5, punches=300)
+    port = server.server_address[1]
+    try:
+        conn = ZK("127.0.0.1", port=port, ommit_ping=True).connect()
+        try:
+            assert len(conn.get_users()) == 5
+            assert len(conn.get_attendance()) == 300
+        finally:
+            conn.disconnect()
+
+        async def fetch():
+            device = AsyncZKTecoAttendance("127.0.0.1", port=port)
+            await device.connect()
+            try:
+                return await device.get_raw_attendance()
+            finally:
+                await device.disconnect()
+        assert len(asyncio.run(fetch())) == 300
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,35 @@
+"""AttendanceDecoder user id handling"""
+from struct import pack
+import numpy as np
+from attendance_system import ATTENDANCE_DTYPES, AttendanceDecoder
+
+
+def attendance_buffer(record_size, records):
+    """A device attendance buffer: 4-byte total size, then the packed records"""
+    packed = np.zeros(len(records), dtype=ATTENDANCE_DTYPES[record_size])
+    for i, record in enumerate(records):
+        for field, value in record.items():
+            packed[i][field] = value
+    return pack('<I', packed.nbytes) + packed.tobytes()
+
+
+def decode(record_size, records, users_by_uid=None):
+    decoder = AttendanceDecoder(len(records), users_by_uid)
+    decoder.feed(attendance_buffer(record_size, records))
+    return decoder.frame()
+
+
+def test_user_ids_with_bytes_after_the_nul_share_one_category():
+    frame = decode(40, [
+        {'uid': 1, 'user_id': b'42\x00junk', 'timestamp': 1000, 'punch': 0},
+        {'uid': 1, 'user_id': b'42', 'timestamp': 2000, 'punch': 1},
+    ])
+    assert frame['user_id'].tolist() == ['42', '42']
+    assert list(frame['user_id'].cat.categories) == ['42']
+
+
+def test_unknown_uid_matching_a_user_id_shares_one_category():
+    # uid 5 is not in the directory, so it decodes as '5', which uid 9 maps to
+    frame = decode(8, [{'uid': 5, 'timestamp': 1000}, {'uid': 9, 'timestamp': 2000}], {9: '5'})
+    assert frame['user_id'].tolist() == ['5', '5']
+    assert list(frame['user_id'].cat.categories) == ['5']
@@ -0,0 +1,102 @@
+"""merge_punches against a brute-force duplicate check"""
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from attendance_collector import merge_frames, merge_punches
+from attendance_system import decorate_raw
+
+START = datetime(2026, 9, 1, 8)
+
+
+def device_frame(punches, device):
+    """Raw frame for one device from (user_id, seconds after START, punch) tuples"""
+    punches = sorted(punches, key=lambda p: p[1])
+    df = pd.DataFrame({
+        'user_id': [str(user) for user, _, _ in punches],
+        'timestamp': [START + timedelta(seconds=int(s)) for _, s, _ in punches],
+        'raw_status': np.ones(len(punches), dtype=np.int16),
+        'punch': np.array([p for _, _, p in punches], dtype=np.int16),
+    })
+    return decorate_raw(df, {}, device)
+
+
+def merge_brute_force(frames, window_seconds, match_punch):
+    """Drop each punch that has an earlier punch of the same user (and kind) at most window_seconds before it"""
+    merged = merge_frames(frames)
+    if not window_seconds:
+        return merged
+    window = timedelta(seconds=window_seconds)
+    rows = list(merged[['user_id', 'timestamp', 'punch']].itertuples(index=False))
+    keep = []
+    for i, row in enumerate(rows):
+        keep.append(not any(
+            other.user_id == row.user_id
+            and (other.punch == row.punch or not match_punch)
+            and row.timestamp - other.timestamp <= window
+            for other in rows[:i]
+        ))
+    return merged[keep].reset_index(drop=True)
+
+
+def random_frames(seed, devices=3, count=120, users=4):
+    """Dense punches, so bursts chain and several devices share timestamps"""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 1800, size=count)
+    # Copy some punches onto other devices at the same second
+    shared = rng.choice(count, size=count // 4, replace=False)
+    punches = [(int(u), int(s), int(p)) for u, s, p in zip(
+        rng.integers(1, users + 1, size=count), seconds, rng.choice([0, 1, 255], size=count))]
+    per_device = [[] for _ in range(devices)]
+    for i, punch in enumerate(punches):
+        per_device[i % devices].append(punch)
+        if i in shared:
+            per_device[(i + 1) % devices].append(punch)
+    return [device_frame(p, f"10.0.0.{d}:4370") for d, p in enumerate(per_device)]
+
+
+CHAINED_BURST = [
+    # One user punching every 50s: each repeat is within 60s of the previous
+    # one, so the whole burst collapses although it spans 200s
+    [(1, 0, 0), (1, 100, 0), (1, 200, 0), (1, 261, 0)],
+    [(1, 50, 0), (1, 150, 0), (1, 321, 0)],
+]
+SAME_SECOND = [
+    # Same user and second on three devices, plus a different kind at that second
+    [(1, 10, 0), (2, 10, 0)],
+    [(1, 10, 0), (1, 10, 1)],
+    [(1, 10, 0), (2, 70, 0)],
+]
+CASES = [
+    ("chained burst", CHAINED_BURST),
+    ("same second", SAME_SECOND),
+    ("window edge", [[(1, 0, 0), (1, 60, 0), (1, 121, 0)], [(1, 181, 0), (1, 182, 1)]]),
+]
+
+
+@pytest.mark.parametrize("match_punch", [True, False])
+@pytest.mark.parametrize("window_seconds", [0, 1, 60, 3600])
+@pytest.mark.parametrize("name, punches", CASES, ids=[name for name, _ in CASES])
+def test_merge_punches_matches_brute_force(name, punches, window_seconds, match_punch):
+    frames = [device_frame(p, f"10.0.0.{d}:4370") for d, p in enumerate(punches)]
+    expected = merge_brute_force(frames, window_seconds, match_punch)
+    pd.testing.assert_frame_equal(merge_punches(frames, window_seconds, match_punch), expected)
+
+
+@pytest.mark.parametrize("match_punch", [True, False])
+@pytest.mark.parametrize("window_seconds", [0, 1, 60, 300])
+@pytest.mark.parametrize("seed", range(4))
+def test_merge_punches_matches_brute_force_random(seed, window_seconds, match_punch):
+    frames = random_frames(seed)
+    expected = merge_brute_force(frames, window_seconds, match_punch)
+    pd.testing.assert_frame_equal(merge_punches(frames, window_seconds, match_punch), expected)
+
+
+def test_chained_burst_keeps_only_its_first_punch():
+    kept = merge_punches([device_frame(p, f"10.0.0.{d}:4370") for d, p in enumerate(CHAINED_BURST)], 60)
+    assert kept['timestamp'].tolist() == [START, START + timedelta(seconds=261)]
+
+
+def test_window_zero_keeps_same_second_punches():
+    frames = [device_frame(p, f"10.0.0.{d}:4370") for d, p in enumerate(SAME_SECOND)]
+    assert len(merge_punches(frames, 0)) == sum(len(p) for p in SAME_SECOND)
@@ -0,0 +1,115 @@
+"""Parity of pair_attendance with the original iterrows pairing loop"""
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from attendance_system import PAIRED_COLUMNS, decorate_raw, pair_attendance
+
+
+def pair_with_iterrows(df):
+    """The pairing loop get_attendance used before pair_attendance"""
+    df = df.sort_values(['user_id', 'timestamp'])
+    grouped_records = []
+    current_user = None
+    current_date = None
+    check_in = None
+    check_out = None
+    for _, row in df.iterrows():
+        user_id = row['user_id']
+        user_name = row['user_name']
+        timestamp = row['timestamp']
+        date = timestamp.date()
+        punch = row['punch']
+        if current_user != user_id or current_date != date:
+            if current_user is not None and check_in is not None:
+                grouped_records.append({
+                    'user_id': current_user,
+                    'user_name': current_user_name,
+                    'date': current_date,
+                    'check_in': check_in,
+                    'check_out': check_out
+                })
+            current_user = user_id
+            current_user_name = user_name
+            current_date = date
+            check_in = None
+            check_out = None
+        if punch == 0:
+            check_in = timestamp
+        elif punch == 1:
+            check_out = timestamp
+    if current_user is not None and check_in is not None:
+        grouped_records.append({
+            'user_id': current_user,
+            'user_name': current_user_name,
+            'date': current_date,
+            'check_in': check_in,
+            'check_out': check_out
+        })
+    result_df = pd.DataFrame(grouped_records)
+    if not result_df.empty:
+        result_df['duration'] = result_df.apply(
+            lambda row: (row['check_out'] - row['check_in']).total_seconds() / 3600
+            if pd.notnull(row['check_out']) else None,
+            axis=1
+        )
+    return result_df
+
+
+def random_punches(seed, count=3000, users=40, days=10):
+    """Raw punches with unknown punch codes and days that have no check-in"""
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, users + 1, size=count)
+    # Unique seconds per punch, so the unstable reference sort has no ties to break
+    seconds = rng.choice(days * 86400, size=count, replace=False)
+    punches = rng.choice([0, 1, 2, 4, 5, 255], size=count, p=[0.4, 0.4, 0.05, 0.05, 0.05, 0.05])
+    # Some users only ever check out, so their days have no check-in
+    punches[np.isin(user_ids, [3, 17])] = 1
+    df = pd.DataFrame({
+        'user_id': user_ids.astype(str),
+        'timestamp': np.datetime64(datetime(2026, 9, 1)) + seconds.astype('timedelta64[s]'),
+        'raw_status': np.ones(count, dtype=np.int16),
+        'punch': punches.astype(np.int16),
+    }).sort_values('timestamp', ignore_index=True)
+    names = {str(uid): f"User {uid}" for uid in range(1, users + 1) if uid != 7}  # 7 is unknown
+    return decorate_raw(df, names, "127.0.0.1:4370")
+
+
+def normalized(df):
+    """Compare on plain values: object ids and names, datetime64 times, float hours"""
+    df = df[PAIRED_COLUMNS].reset_index(drop=True)
+    return pd.DataFrame({
+        'user_id': df['user_id'].astype(str).values,
+        'user_name': df['user_name'].astype(str).values,
+        'date': df['date'].astype(object).values,
+        'check_in': pd.to_datetime(df['check_in']).values.astype('datetime64[s]'),
+        'check_out': pd.to_datetime(df['check_out']).values.astype('datetime64[s]'),
+        'duration': df['duration'].astype(float).values,
+    })
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pair_attendance_matches_iterrows_loop(seed):
+    raw = random_punches(seed)
+    expected = pair_with_iterrows(raw)
+    actual = pair_attendance(raw)
+    pd.testing.assert_frame_equal(normalized(actual), normalized(expected))
+
+
+def test_days_without_check_in_are_dropped():
+    raw = random_punches(0)
+    paired = pair_attendance(raw)
+    assert not paired['user_id'].isin(['3', '17']).any()
+    assert paired['check_in'].notna().all()
+
+
+def test_unknown_punch_codes_only():
+    start = datetime(2026, 9, 1, 8)
+    df = pd.DataFrame({
+        'user_id': ['1', '1'],
+        'timestamp': [start, start + timedelta(hours=8)],
+        'raw_status': np.ones(2, dtype=np.int16),
+        'punch': np.array([4, 5], dtype=np.int16),
+    })
+    assert pair_attendance(decorate_raw(df, {'1': "Ann"}, "dev")).empty
+    assert pair_with_iterrows(decorate_raw(df, {'1': "Ann"}, "dev")).empty
@@ -0,0 +1,28 @@
+"""SessionManager idle handling against the simulated device"""
+import time
+from attendance_session import DISCONNECTED, SessionManager
+from attendance_simulator import start_simulator
+
+
+def test_idle_closed_session_stays_registered_and_closable():
+    server = start_simulator(port=0, users=5, punches=10)
+    port = server.server_address[1]
+    manager = SessionManager(keepalive_interval=0.2, idle_timeout=0.5)
+    try:
+        session = manager.get("127.0.0.1", port)
+        session.attendance_system.zk.ommit_ping = True  # The simulator does not answer ping
+        assert session.open()
+        deadline = time.monotonic() + 5
+        while session.state != DISCONNECTED and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert session.state == DISCONNECTED
+        # run() reconnects the same registered session, so close() still reaches it
+        session.run(lambda a: a.conn.get_time())
+        assert session.is_alive
+        assert manager.get("127.0.0.1", port) is session
+        manager.close("127.0.0.1", port)
+        assert not session.is_alive
+    finally:
+        manager.close_all()
+        server.shutdown()
+        server.server_close()